@@ -0,0 +1,78 @@
+from asnake.client import AsyncASnakeClient
+from asnake.jsonmodel.aio import *
+from asnake.jsonmodel.aio import wrap_json_object
+from boltons.setutils import IndexedSet
+import re
+
+class AsyncASpace():
+    '''Async counterpart to :class:`asnake.aspace.ASpace`, using an :class:`asnake.client.aio.AsyncASnakeClient`.
+
+Since authorizing needs a request, it happens on entering the object as an async context manager
+(or by awaiting :meth:`authorize`), rather than on creation:
+
+.. code-block:: python
+
+    async with AsyncASpace() as aspace:
+        async for ao in aspace.repositories(2).archival_objects:
+            print(ao.title)
+'''
+    def __init__(self, **config):
+        self.client = AsyncASnakeClient(**config)
+        self.version = 'unknown version'
+
+    async def authorize(self):
+        '''Authorize the client and fetch the version of ArchivesSpace it's talking to.'''
+        await self.client.authorize()
+        m = re.match(r'\(v?(.+\))', (await self.client.get('version')).text)
+        if m:
+            self.version = m[1]
+        return self
+
+    async def __aenter__(self):
+        return await self.authorize()
+
+    async def __aexit__(self, *exc_info):
+        await self.client.aclose()
+
+    def __getattr__(self, attr):
+        '''returns the AsyncJSONModelRelation representing the route with the same name as the attribute requested.'''
+        if not attr.startswith('_'):
+            return AsyncJSONModelRelation("/{}".format(attr), params={"all_ids": True}, client = self.client)
+
+    @property
+    def resources(self):
+        '''return all resources from every repo.'''
+        return AsyncResourceRelation({}, self.client)
+
+    @property
+    def agents(self):
+        '''returns an AsyncAgentRelation.'''
+        return AsyncAgentRelation("/agents", {}, self.client)
+
+    @property
+    def users(self):
+        '''returns an AsyncUserRelation.'''
+        return AsyncUserRelation("/users", {}, self.client)
+
+    async def by_external_id(self, external_id, record_types=None):
+        '''async iterator over any resources fetched from the 'by-external-id' route.
+
+See :meth:`asnake.aspace.ASpace.by_external_id`.'''
+        params = {"eid": external_id}
+        if record_types: params['type[]'] = record_types
+
+        res = await self.client.get('by-external-id', params=params)
+        if res.status_code == 404:
+            return
+        elif res.status_code == 300: # multiple returns, bare list of uris
+            for uri in IndexedSet(res.json()):
+                yield wrap_json_object({"ref": uri}, self.client)
+        elif res.status_code == 200: # single obj, redirects to obj with 303->200
+            yield wrap_json_object(res.json(), self.client)
+        else:
+            from asnake.aspace import ASnakeBadReturnCode
+            raise ASnakeBadReturnCode("by-external-id call returned '{}'".format(res.status_code))
+
+    async def from_uri(self, uri):
+        '''returns an AsyncJSONModelObject representing the URI passed in'''
+        return wrap_json_object((await self.client.get(uri)).json(), self.client)
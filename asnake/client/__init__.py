@@ -1 +1,2 @@
 from .web_client import ASnakeClient
+from .aio import AsyncASnakeClient
@@ -0,0 +1,290 @@
+'''asyncio counterpart to :class:`asnake.client.web_client.ASnakeClient`.
+
+Requires `httpx <https://www.python-httpx.org/>`_, which is not installed by default.  Install
+it directly, or via the `async` extra (`pip install ArchivesSnake[async]`).'''
+from urllib.parse import quote
+from boltons.cacheutils import LRU
+from numbers import Number
+
+import asyncio
+import json
+import asnake.logging as logging
+import asnake.jsonlib as jsonlib
+from asnake.concurrency import async_bounded_map
+from asnake.client.ratelimit import AsyncRateLimiter
+from asnake.client.web_client import ASnakeAuthError, ASnakeWeirdReturnError, php_params, load_config, \
+    drop_tree_indexes, changes_resource_index
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+log = None # initialized on first client init
+
+class _ReentrantLock:
+    '''asyncio.Lock which the task holding it can acquire again, so reauthorize can call authorize.'''
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.owner = None
+        self.depth = 0
+
+    async def __aenter__(self):
+        task = asyncio.current_task()
+        if self.owner is not task:
+            await self.lock.acquire()
+            self.owner = task
+        self.depth += 1
+
+    async def __aexit__(self, *exc_info):
+        self.depth -= 1
+        if self.depth == 0:
+            self.owner = None
+            self.lock.release()
+
+def async_http_meth_factory(meth):
+    '''Utility method for producing HTTP proxy coroutines for AsyncASnakeProxyMethods mixin class.
+
+    Behaves like :func:`asnake.client.web_client.http_meth_factory`, but arguments are passed
+    to :meth:`httpx.AsyncClient.request`, and the result must be awaited.  Requests wait on the
+    client's :class:`asnake.client.ratelimit.AsyncRateLimiter` before being sent, and retried
+    according to the same `max_retries`, `retry_status_codes` and `retry_methods` config values.'''
+    async def http_method(self, url, *args, **kwargs):
+        if 'params' in kwargs:
+            kwargs['params'] = php_params(kwargs['params'])
+
+        full_url = "/".join([self.config['baseurl'].rstrip("/"), url.lstrip("/")])
+        body = kwargs.get('json')
+        kwargs = jsonlib.encode_body(kwargs, 'content')
+        sent_token = self.session.headers.get(self.config['session_header_name'])
+        result = await self._send(meth.upper(), full_url, *args, **kwargs)
+        if result.status_code == 403 and self.config['retry_with_auth']:
+            await self.reauthorize(sent_token)
+            result = await self._send(meth.upper(), full_url, *args, **kwargs)
+        log.debug("proxied http method", method=meth.upper(), url=full_url, status=result.status_code)
+        if meth in {'post', 'put', 'delete'}:
+            if self.tree_indexes:
+                drop_tree_indexes(self.tree_indexes, url, body)
+            if self.resource_index is not None and changes_resource_index(meth, url):
+                self.resource_index = None
+        return jsonlib.install(result)
+    return http_method
+
+class AsyncASnakeProxyMethods(type):
+    '''Metaclass to set up proxy coroutines for all supported HTTP methods'''
+    def __init__(cls, name, parents, dct):
+
+        for meth in ('get', 'post', 'head', 'put', 'delete', 'options',):
+            fn = async_http_meth_factory(meth)
+            fn.__name__ = meth
+            fn.__doc__ = '''Proxied {} request via :meth:`httpx.AsyncClient.request`'''.format(meth.upper())
+
+            setattr(cls, meth, fn)
+
+class AsyncASnakeClient(metaclass=AsyncASnakeProxyMethods):
+    '''ArchivesSnake Web Client for use with asyncio.
+
+Takes the same configuration as :class:`asnake.client.web_client.ASnakeClient`, including its
+retry policy, and provides the same methods, as coroutines.  :meth:`get_paged` returns an async iterator:
+
+.. code-block:: python
+
+    async with AsyncASnakeClient() as client:
+        await client.authorize()
+        async for repo in client.get_paged('repositories'):
+            print(repo['name'])
+'''
+
+    def __init__(self, **config):
+        global log
+
+        if httpx is None:
+            raise ImportError("AsyncASnakeClient requires httpx, install it with 'pip install ArchivesSnake[async]'")
+
+        self.config = load_config(config)
+        if not log:
+            log = logging.get_logger(__name__)
+
+        if not hasattr(self, 'session'):
+            # httpx only retries failed connections, error statuses are retried in _send
+            # limits go on the transport, AsyncClient ignores its own when given one
+            # redirects are followed and there's no timeout, as with requests in ASnakeClient
+            self.session = httpx.AsyncClient(
+                follow_redirects=True,
+                timeout=None,
+                transport=httpx.AsyncHTTPTransport(
+                    retries=self.config['max_retries'],
+                    limits=httpx.Limits(max_connections=self.config['pool_maxsize'],
+                                        max_keepalive_connections=self.config['pool_maxsize'])))
+        self.session.headers.update({'Accept': 'application/json',
+                                     'User-Agent': 'ArchivesSnake/0.1'})
+        self.auth_lock = None
+        self.rate_limiter = AsyncRateLimiter.from_config(self.config)
+        self.tree_indexes = LRU(max_size=self.config['tree_index_size']) if self.config['tree_index_size'] else None
+        self.resource_index = None
+        log.debug("async client created")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        '''Close the underlying :class:`httpx.AsyncClient` and its connections.'''
+        await self.session.aclose()
+
+    async def authorize(self, username=None, password=None, session_token=None, session_header_name=None):
+        '''Authorizes the client against the configured archivesspace instance.
+
+        See :meth:`asnake.client.web_client.ASnakeClient.authorize`.'''
+
+        # Populate values from config if empty
+        username      = username or self.config.get('username', None)
+        password      = password or self.config.get('password', None)
+        session_token = session_token or self.config.get('session_token', None)
+
+        if all((username, password, session_token,)):
+            log.debug('argument error in authorize')
+            raise ASnakeAuthError("Cannot set both username/password and session_token")
+
+        session_header_name = session_header_name or self.config['session_header_name']
+
+        async with self._auth_lock():
+            # If we have a session_token already
+            if session_token:
+                self.session.headers[session_header_name] = session_token
+                log.debug("setting session token directly")
+                return session_token
+
+            # Otherwise, use ASpace login to get one
+            log.debug("authorizing against ArchivesSpace", user=username)
+
+            resp = await self.session.post(
+                "/".join([self.config['baseurl'].rstrip("/"), 'users/{username}/login']).format(username=quote(username)),
+                data={"password": password, "expiring": False}
+            )
+
+            if resp.status_code != 200:
+                log.debug("authorization failure", status=resp.status_code)
+                raise ASnakeAuthError("Failed to authorize ASnake with status: {}".format(resp.status_code))
+            else:
+                session_token = json.loads(resp.text)['session']
+                self.session.headers[session_header_name] = session_token
+                log.debug("authorization success", session_token=session_token)
+                return session_token
+
+    async def reauthorize(self, stale_token):
+        '''Re-authorize after a request sent with `stale_token` was refused, once across all tasks.
+
+See :meth:`asnake.client.web_client.ASnakeClient.reauthorize`.'''
+        async with self._auth_lock():
+            current_token = self.session.headers.get(self.config['session_header_name'])
+            if current_token is not None and current_token != stale_token:
+                return current_token
+            return await self.authorize()
+
+    async def _send(self, method, url, *args, **kwargs):
+        '''Send a request, retrying it as :func:`asnake.client.web_client.http_adapter` sets up for ASnakeClient.
+
+httpx itself only retries failed connections, so responses with any of the `retry_status_codes` to
+`retry_methods` are retried here, up to `max_retries` times, waiting
+`retry_backoff_factor * 2 ** (retry number - 1)` seconds between attempts, or as long as a
+Retry-After header asks.'''
+        retries = self.config['max_retries'] if method in self.config['retry_methods'] else 0
+        attempt = 0
+        while True:
+            async with self.rate_limiter:
+                result = await self.session.request(method, url, *args, **kwargs)
+            self.rate_limiter.update(result)
+            if attempt >= retries or result.status_code not in self.config['retry_status_codes']:
+                return result
+            attempt += 1
+            delay = self.config['retry_backoff_factor'] * 2 ** (attempt - 1)
+            retry_after = result.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+            log.debug("retrying request", method=method, url=url, status=result.status_code, attempt=attempt)
+            await asyncio.sleep(delay)
+
+    def _auth_lock(self):
+        # created on first use, so that it belongs to the loop the client is used on
+        if self.auth_lock is None:
+            self.auth_lock = _ReentrantLock()
+        return self.auth_lock
+
+    async def get_paged(self, url, *args, page_size=100, workers=None, **kwargs):
+        '''async iterator over json objects from urls of paged items
+
+See :meth:`asnake.client.web_client.ASnakeClient.get_paged`; here, `workers` is the number
+of requests allowed in flight at once.'''
+        params = {}
+        workers = workers or self.config['paged_workers']
+
+        if "params" in kwargs:
+            params.update(**kwargs['params'])
+            del kwargs['params']
+
+        # special-cased bc all_ids doesn't work on repositories index route
+        if "all_ids" in params and url in {"/repositories", "repositories"}:
+            del params['all_ids']
+
+        params.update(page_size=page_size, page=1)
+
+        current_json = (await self.get(url, params=params, **kwargs)).json()
+        # Regular paged object
+        if hasattr(current_json, 'keys') and \
+           {'results', 'this_page', 'last_page'} <= set(current_json.keys()):
+            for obj in current_json['results']:
+                yield obj
+
+            async def fetch_page(page):
+                return (await self.get(url, params=dict(params, page=page))).json()['results']
+
+            async for results in async_bounded_map(fetch_page,
+                                                   range(current_json['this_page'] + 1, current_json['last_page'] + 1),
+                                                   workers=workers):
+                for obj in results:
+                    yield obj
+        # routes that just return a list,  or ids, i.e. queries with all_ids param
+        elif isinstance(current_json, list):
+            # e.g. repositories
+            if len(current_json) >= 1:
+                if hasattr(current_json[0], 'keys'):
+                    for obj in current_json:
+                        yield obj
+                elif isinstance(current_json[0], Number):
+                    async for obj in self.get_by_ids(url, current_json, workers=workers):
+                        yield obj
+                else:
+                    raise ASnakeWeirdReturnError("get_paged doesn't know how to handle {}".format(current_json))
+        else:
+            raise ASnakeWeirdReturnError("get_paged doesn't know how to handle {}".format(current_json))
+
+    async def get_by_ids(self, url, ids, workers=None, batch_size=None):
+        '''async iterator over json objects with the given ids from an index route, in the order of ids.
+
+See :meth:`asnake.client.web_client.ASnakeClient.get_by_ids`.'''
+        workers = workers or self.config['paged_workers']
+        batch_size = batch_size or self.config['id_batch_size']
+
+        if not batch_size:
+            async def fetch_one(i):
+                return (await self.get("/".join([url, str(i)]))).json()
+
+            async for obj in async_bounded_map(fetch_one, ids, workers=workers):
+                yield obj
+            return
+
+        async def fetch_batch(batch):
+            result = (await self.get(url, params={"id_set": batch})).json()
+            if not isinstance(result, list):
+                raise ASnakeWeirdReturnError("id_set query to {} returned {}".format(url, result))
+            by_id = {int(obj['uri'].split('/')[-1]): obj for obj in result}
+            return [by_id[i] for i in batch if i in by_id]
+
+        ids = list(ids)
+        batches = (ids[start:start + batch_size] for start in range(0, len(ids), batch_size))
+        async for objs in async_bounded_map(fetch_batch, batches, workers=workers):
+            for obj in objs:
+                yield obj
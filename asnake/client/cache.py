@@ -0,0 +1,167 @@
+'''Opt-in cache for GET responses made through :class:`asnake.client.web_client.ASnakeClient`.
+
+Configured via the `cache` key of :class:`asnake.configurator.ASnakeConfig`, e.g.:
+
+.. code-block:: yaml
+
+    cache:
+        backend: sqlite          # or 'memory' (the default)
+        path: ~/.archivessnake_cache.sqlite
+        maxsize: 10000           # entries kept before least recently used are evicted
+        ttl: 600                 # seconds, omit to keep responses until evicted
+        route_ttls:              # per-route ttls, first matching regex wins; 0 means don't cache
+            'repositories/\\d+/search': 0
+            '^/?agents/': 3600
+
+Only successful responses are cached.  Any POST, PUT or DELETE the client makes to a URI drops
+cached responses for that URI and routes below it.'''
+from boltons.cacheutils import LRU
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from urllib.parse import urlsplit
+from os.path import expanduser
+from threading import RLock
+from time import time
+
+import json
+import asnake.jsonlib as jsonlib
+import re
+import sqlite3
+
+class MemoryCacheBackend:
+    '''In-memory least-recently-used store of cached responses.'''
+    def __init__(self, maxsize=1000):
+        self.entries = LRU(max_size=maxsize)
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, path, entry):
+        self.entries[key] = (path, entry)
+
+    def delete(self, key):
+        self.entries.pop(key, None)
+
+    def invalidate(self, path):
+        for key, (entry_path, _) in list(self.entries.items()):
+            if entry_path == path or entry_path.startswith(path + '/'):
+                self.entries.pop(key, None)
+
+    def clear(self):
+        self.entries.clear()
+
+class SQLiteCacheBackend:
+    '''On-disk store of cached responses, which persists between runs.
+
+Least recently used entries are evicted once there are more than `maxsize`.'''
+    def __init__(self, path="~/.archivessnake_cache.sqlite", maxsize=100000):
+        self.maxsize = maxsize
+        self.lock = RLock()
+        self.db = sqlite3.connect(expanduser(path), check_same_thread=False)
+        with self.lock, self.db:
+            self.db.execute('''CREATE TABLE IF NOT EXISTS responses (
+                                 key TEXT PRIMARY KEY, path TEXT, entry TEXT, used REAL)''')
+            self.db.execute('CREATE INDEX IF NOT EXISTS responses_path ON responses (path)')
+            self.db.execute('CREATE INDEX IF NOT EXISTS responses_used ON responses (used)')
+
+    def get(self, key):
+        with self.lock, self.db:
+            row = self.db.execute('SELECT path, entry FROM responses WHERE key = ?', (key,)).fetchone()
+            if row:
+                self.db.execute('UPDATE responses SET used = ? WHERE key = ?', (time(), key,))
+                return row[0], jsonlib.loads(row[1])
+
+    def set(self, key, path, entry):
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)',
+                            (key, path, jsonlib.dumps(entry), time(),))
+            self.db.execute('''DELETE FROM responses WHERE key IN (
+                                 SELECT key FROM responses ORDER BY used DESC LIMIT -1 OFFSET ?)''', (self.maxsize,))
+
+    def delete(self, key):
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM responses WHERE key = ?', (key,))
+
+    def invalidate(self, path):
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM responses WHERE path = ? OR substr(path, 1, ?) = ?",
+                            (path, len(path) + 1, path + '/',))
+
+    def clear(self):
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM responses')
+
+backends = {
+    'memory': MemoryCacheBackend,
+    'sqlite': SQLiteCacheBackend,
+}
+
+class ResponseCache:
+    '''Cache of GET responses keyed by URL and normalized params, with a default and per-route ttl.'''
+    def __init__(self, backend, ttl=None, route_ttls=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.route_ttls = [(re.compile(pattern), route_ttl) for pattern, route_ttl in (route_ttls or {}).items()]
+
+    @classmethod
+    def from_config(cls, cache_config):
+        '''Build a ResponseCache from the `cache` config hash, or return None if caching is off.'''
+        if not cache_config:
+            return None
+        if cache_config is True:
+            cache_config = {}
+        options = {k:cache_config[k] for k in ('path', 'maxsize',) if k in cache_config}
+        backend = backends[cache_config.get('backend', 'memory')](**options)
+        return cls(backend, cache_config.get('ttl', None), cache_config.get('route_ttls', None))
+
+    def ttl_for(self, url):
+        '''Seconds to keep responses from url for, None for no expiry, or 0 to not cache them at all.'''
+        for pattern, route_ttl in self.route_ttls:
+            if pattern.search(url):
+                return route_ttl
+        return self.ttl
+
+    @staticmethod
+    def key(full_url, params):
+        normalized = sorted((k, list(v) if isinstance(v, (list, tuple)) else v) for k, v in (params or {}).items())
+        return json.dumps([full_url, normalized], default=str)
+
+    def get(self, full_url, params):
+        '''Return cached response for a GET of full_url with params, or None.'''
+        key = self.key(full_url, params)
+        cached = self.backend.get(key)
+        if cached:
+            _, entry = cached
+            if entry['expires'] is None or entry['expires'] > time():
+                return rebuild_response(entry)
+            self.backend.delete(key)
+
+    def store(self, url, full_url, params, response):
+        '''Store response to a GET of full_url with params, if it's cacheable.'''
+        ttl = self.ttl_for(url)
+        if response.status_code != 200 or ttl == 0:
+            return
+        self.backend.set(self.key(full_url, params), urlsplit(full_url).path, {
+            'expires': time() + ttl if ttl else None,
+            'status_code': response.status_code,
+            'headers': dict(response.headers),
+            'content': response.content.decode(response.encoding or 'utf8'),
+            'encoding': response.encoding,
+            'url': response.url,
+        })
+
+    def invalidate(self, full_url):
+        '''Drop cached responses for full_url and any routes below it.'''
+        self.backend.invalidate(urlsplit(full_url).path.rstrip('/'))
+
+    def clear(self):
+        self.backend.clear()
+
+def rebuild_response(entry):
+    response = Response()
+    response.status_code = entry['status_code']
+    response.headers = CaseInsensitiveDict(entry['headers'])
+    response.encoding = entry['encoding']
+    response._content = entry['content'].encode(entry['encoding'] or 'utf8')
+    response.url = entry['url']
+    return response
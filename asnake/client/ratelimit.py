@@ -0,0 +1,115 @@
+'''Client-side limits on how hard :class:`asnake.client.web_client.ASnakeClient` pushes ArchivesSpace.
+
+A :class:`RateLimiter` is shared by every thread using a client, and combines:
+
+- a token bucket capping requests per second (`rate_limit` in config)
+- a cap on the number of requests in flight at once (`max_concurrent_requests` in config)
+- backing off when the server answers 429 or 503: the rate is halved (down to a floor of
+  `rate_limit / 20`) and crept back up by `rate_limit / 20` with each successful response,
+  and any Retry-After header pauses all requests for as long as it asks
+
+:class:`AsyncRateLimiter` does the same for :class:`asnake.client.aio.AsyncASnakeClient`, sleeping
+with asyncio rather than blocking the event loop.'''
+from threading import Lock, BoundedSemaphore
+from time import monotonic, sleep
+import asyncio
+
+backoff_statuses = frozenset({429, 503})
+
+class RateLimiter:
+    '''Token bucket rate limiter and concurrency cap, used as a context manager around each request.
+
+With neither `rate` nor `max_concurrent` set, it only honours Retry-After headers.'''
+    def __init__(self, rate=None, max_concurrent=None, burst=None, adaptive=True):
+        self.max_rate = rate
+        self.rate = rate
+        self.adaptive = adaptive
+        self.capacity = burst or max(1, rate or 1)
+        self.tokens = self.capacity
+        self.last_refill = monotonic()
+        self.paused_until = 0
+        self.lock = Lock()
+        self.slots = BoundedSemaphore(max_concurrent) if max_concurrent else None
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(rate=config['rate_limit'],
+                   max_concurrent=config['max_concurrent_requests'],
+                   burst=config['rate_limit_burst'],
+                   adaptive=config['rate_limit_adaptive'])
+
+    def _take(self):
+        '''Take a token if a request may be sent now, returning 0, or else the seconds to wait before trying again.'''
+        with self.lock:
+            now = monotonic()
+            delay = self.paused_until - now
+            if delay <= 0 and self.rate:
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return 0
+                return (1 - self.tokens) / self.rate
+            return max(delay, 0)
+
+    def wait(self):
+        '''Block until a request may be sent, taking a token for it.'''
+        while True:
+            delay = self._take()
+            if delay <= 0:
+                return
+            sleep(delay)
+
+    def __enter__(self):
+        if self.slots:
+            self.slots.acquire()
+        try:
+            self.wait()
+        except BaseException:
+            if self.slots: self.slots.release()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.slots:
+            self.slots.release()
+
+    def update(self, response):
+        '''Adjust rate according to a response's status and headers.'''
+        with self.lock:
+            if response.status_code in backoff_statuses:
+                retry_after = response.headers.get('Retry-After', '')
+                if retry_after.isdigit():
+                    self.paused_until = max(self.paused_until, monotonic() + int(retry_after))
+                if self.adaptive and self.rate:
+                    self.rate = max(self.max_rate / 20, self.rate / 2)
+            elif self.adaptive and self.rate and self.rate < self.max_rate and response.status_code < 400:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+class AsyncRateLimiter(RateLimiter):
+    ''':class:`RateLimiter` for asyncio, used as an async context manager around each request.'''
+    def __init__(self, rate=None, max_concurrent=None, burst=None, adaptive=True):
+        super().__init__(rate=rate, burst=burst, adaptive=adaptive)
+        self.slots = asyncio.Semaphore(max_concurrent) if max_concurrent else None
+
+    async def async_wait(self):
+        '''Wait until a request may be sent, taking a token for it.'''
+        while True:
+            delay = self._take()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+    async def __aenter__(self):
+        if self.slots:
+            await self.slots.acquire()
+        try:
+            await self.async_wait()
+        except BaseException:
+            if self.slots: self.slots.release()
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self.slots:
+            self.slots.release()
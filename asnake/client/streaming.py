@@ -0,0 +1,162 @@
+'''Incremental parsing of large JSON responses, so that results can be used as they arrive.
+
+Used by :meth:`asnake.client.web_client.ASnakeClient.get_paged` and the abstraction layer when
+the `stream_json` config value is set.  Parsing is done with `ijson <https://pypi.org/project/ijson/>`_,
+which is not installed by default; install it directly, or via the `streaming` extra
+(`pip install ArchivesSnake[streaming]`).  Without it, responses are parsed all at once as usual,
+and the functions here just iterate over the result.
+
+Responses should be requested with `stream=True`, or they'll already be held in memory whole.'''
+from io import BytesIO
+
+try:
+    import ijson
+    from ijson.common import ObjectBuilder
+except ImportError:
+    ijson = None
+
+scalar_events = frozenset({'null', 'boolean', 'integer', 'double', 'number', 'string'})
+
+def _events(response):
+    '''ijson parse events for response's body.'''
+    if response.raw is not None and not response._content_consumed:
+        response.raw.decode_content = True
+        return ijson.parse(response.raw)
+    return ijson.parse(BytesIO(response.content))
+
+def iter_items(response, *prefixes):
+    '''Yield the items of arrays in response's JSON as each is parsed.
+
+`prefixes` are dotted paths to arrays in the JSON, with `item` standing for array members, as in
+ijson, e.g. `results` for paged responses, an empty string for a bare list, or `response.docs` for
+Solr results.  Returns a dict of the scalar values at the top level of the JSON (e.g. `this_page`
+and `last_page`), so callers can get both with `meta = yield from iter_items(response, 'results')`.'''
+    if ijson is None:
+        return (yield from _iter_parsed(response.json(), prefixes))
+
+    item_prefixes = frozenset('.'.join(filter(None, (prefix, 'item'))) for prefix in prefixes)
+    meta = {}
+    builder = current = None
+    for prefix, event, value in _events(response):
+        if current is not None:
+            builder.event(event, value)
+            # an item ends with the closing event at its own prefix
+            if prefix == current and event in {'end_map', 'end_array'}:
+                yield builder.value
+                builder = current = None
+        elif prefix in item_prefixes:
+            if event in scalar_events:
+                yield value
+            else:
+                builder, current = ObjectBuilder(), prefix
+                builder.event(event, value)
+        elif event in scalar_events and prefix and '.' not in prefix:
+            meta[prefix] = value
+    return meta
+
+def _iter_parsed(parsed, prefixes):
+    '''Fallback for iter_items, when there's no ijson.'''
+    for prefix in prefixes:
+        container = parsed
+        for key in filter(None, prefix.split('.')):
+            if key == 'item' and isinstance(container, list):
+                continue
+            container = container.get(key) if isinstance(container, dict) else None
+        if isinstance(container, list):
+            yield from container
+    if isinstance(parsed, dict):
+        return {k:v for k, v in parsed.items() if not isinstance(v, (dict, list))}
+    return {}
+
+def iter_tree(response):
+    '''Yield `(depth, node)` for each node of a tree response (e.g. from a resource's `tree` route) in depth-first order.
+
+Each node is yielded without its `children`, as soon as both its `record_uri` and the start of
+its children have been parsed, so normally only the nodes above the one being parsed are held in
+memory.  Nodes below one whose `record_uri` follows its children are held until it's been parsed.
+Any other fields that follow `children` are added to the node's dict once they've been parsed.'''
+    if ijson is None:
+        stack = [(0, response.json())]
+        while stack:
+            depth, node = stack.pop()
+            yield depth, {k:v for k, v in node.items() if k != 'children'}
+            stack.extend((depth + 1, child) for child in reversed(node.get('children', [])))
+        return
+
+    open_nodes = [] # from the root down to the node being parsed
+    builder = field = field_prefix = None
+    for prefix, event, value in _events(response):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == field_prefix and event in {'end_map', 'end_array'}:
+                open_nodes[-1].fields[field] = builder.value
+                builder = None
+        elif event == 'start_map' and (prefix == '' or prefix.endswith('children.item')):
+            open_nodes.append(_OpenNode(len(open_nodes)))
+        elif event == 'map_key':
+            field = value
+        elif event == 'start_array' and field == 'children':
+            node = open_nodes[-1]
+            node.in_children = True
+            if 'record_uri' in node.fields:
+                yield from node.release(open_nodes[:-1])
+        elif event == 'end_array' and field == 'children':
+            field = None
+        elif event == 'end_map':
+            node = open_nodes.pop()
+            yield from node.release(open_nodes)
+            field = None
+        elif event in scalar_events:
+            node = open_nodes[-1]
+            node.fields[field] = value
+            if field == 'record_uri' and node.in_children:
+                yield from node.release(open_nodes[:-1])
+        elif event in {'start_map', 'start_array'}:
+            builder, field_prefix = ObjectBuilder(), prefix
+            builder.event(event, value)
+
+class _OpenNode:
+    '''A tree node that iter_tree has started, but not finished, parsing.'''
+    __slots__ = ('depth', 'fields', 'in_children', 'released', 'held')
+
+    def __init__(self, depth):
+        self.depth = depth
+        self.fields = {}
+        self.in_children = False
+        self.released = False
+        self.held = [] # descendants parsed before this node could be yielded
+
+    def release(self, ancestors):
+        '''Yield this node and any descendants it held, unless an ancestor hasn't been yielded yet, which then holds them.'''
+        if self.released:
+            return
+        self.released = True
+        nodes = [(self.depth, self.fields)] + self.held
+        self.held = []
+        for ancestor in reversed(ancestors):
+            if not ancestor.released:
+                ancestor.held.extend(nodes)
+                return
+        yield from nodes
+
+def find_subtree(nodes, uri):
+    '''Rebuild the subtree with record_uri `uri` from `(depth, node)` pairs, as yielded by :func:`iter_tree`.
+
+Stops reading nodes as soon as the subtree is complete, and returns None if `uri` isn't found.'''
+    root = None
+    stack = []
+    for depth, node in nodes:
+        # nodes are used as they are rather than copied, so fields parsed after children still show up
+        node['children'] = []
+        if root is None:
+            if node.get('record_uri') == uri:
+                root = node
+                stack = [(depth, root)]
+            continue
+        if depth <= stack[0][0]:
+            break
+        while stack[-1][0] >= depth:
+            stack.pop()
+        stack[-1][1]['children'].append(node)
+        stack.append((depth, node))
+    return root
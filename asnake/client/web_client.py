@@ -1,11 +1,23 @@
 from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from boltons.cacheutils import LRU
 from urllib.parse import quote
+from threading import RLock
 from numbers import Number
+from itertools import chain
 from collections.abc import Sequence, Mapping
 
+import attr
 import json
+import re
 import asnake.configurator as conf
 import asnake.logging as logging
+import asnake.jsonlib as jsonlib
+from asnake.concurrency import bounded_map
+from asnake.client.cache import ResponseCache
+from asnake.client.ratelimit import RateLimiter
+from asnake.client import streaming
 
 log = None # initialized on first client init
 
@@ -14,26 +26,185 @@ class ASnakeAuthError(ASnakeError): pass
 class ASnakeWeirdReturnError(ASnakeError): pass
 class ASnakeArgumentError(ASnakeError): pass
 
+class ASnakeUpdateError(ASnakeError):
+    '''Raised when ArchivesSpace refuses an update; the refusing :class:`requests.Response` is in `response`.'''
+    def __init__(self, message, response=None):
+        super().__init__(message)
+        self.response = response
+
+class ASnakeConflictError(ASnakeUpdateError): pass
+
+@attr.s(slots=True, frozen=True)
+class BulkResult:
+    '''Outcome of sending one item with :meth:`ASnakeClient.bulk_post` or :meth:`ASnakeClient.bulk_update`.
+
+`response` is the :class:`requests.Response`, or None if the request raised `error` instead.'''
+    uri = attr.ib()
+    json = attr.ib()
+    response = attr.ib(default=None)
+    error = attr.ib(default=None)
+
+    @property
+    def status_code(self):
+        return self.response.status_code if self.response is not None else None
+
+    @property
+    def ok(self):
+        return self.response is not None and self.response.status_code == 200
+
+    @property
+    def conflict(self):
+        '''True if the record was changed by someone else since it was fetched, i.e. its lock_version is stale,
+and it needs to be re-fetched, re-edited and re-sent.'''
+        return self.status_code == 409
+
 def listlike_seq(seq):
     '''Determine if a thing is a list-like (sequence of values) sequence that's not string-like.'''
     return isinstance(seq, Sequence) and not isinstance(seq, (str, bytes, Mapping,))
 
+def php_params(params):
+    '''aspace uses the PHP convention where array-typed form values use names with '[]' appended'''
+    return {k + '[]' if listlike_seq(v) and k[-2:] != '[]' else k:v for k,v in params.items()}
+
+def drop_tree_indexes(tree_indexes, url, body=None):
+    '''Forget the indexed trees (see :class:`asnake.jsonmodel.TreeIndex`) that a write to `url`,
+sending JSON `body`, may have changed: the resource's own tree, the tree holding a record at that
+uri, and the tree of the resource a new archival object is being added to.'''
+    uri = "/" + url.strip("/")
+    resource = body.get('resource') if isinstance(body, Mapping) else None
+    resource_uri = resource.get('ref') if isinstance(resource, Mapping) else None
+    # copied, as other threads may be adding trees
+    for tree_uri, index in list(tree_indexes.items()):
+        if tree_uri in (resource_uri, uri) or uri.startswith(tree_uri + "/") or uri in index.nodes:
+            tree_indexes.pop(tree_uri, None)
+
+# writes that create, delete or move resources, or add or remove repositories
+resource_index_writes = re.compile(r'^/repositories(/\d+(/resources(/\d+/transfer)?)?)?$')
+resource_uri_regex = re.compile(r'^/repositories/\d+/resources/\d+$')
+
+def changes_resource_index(meth, url):
+    '''Whether a `meth` request to `url` may change which repository a resource is in (see :class:`asnake.jsonmodel.ResourceIndex`).'''
+    uri = "/" + url.strip("/")
+    return bool(resource_index_writes.match(uri) or (meth == 'delete' and resource_uri_regex.match(uri)))
+
+def load_config(config):
+    '''Build the :class:`asnake.configurator.ASnakeConfig` for a client from the keyword arguments
+it was created with, setting up logging if this is the first client created.'''
+    global log
+
+    if 'config_file' in config:
+        asnake_config = conf.ASnakeConfig(config['config_file'])
+    else:
+        asnake_config = conf.ASnakeConfig()
+
+    asnake_config.update(config)
+
+    if asnake_config['json_backend']:
+        jsonlib.use(asnake_config['json_backend'])
+
+    # Only a subset of logging config can be supported in config
+    # For more complex setups (configuring output format, say),
+    # configure logs in Python code prior to loading
+    #
+    # Properties supported are:
+    #    filename, filemode, level, and default_config
+    # Default config can be any of the default configurations exposed in logging
+    if not log:
+        if not logging.already_configured and 'logging_config' in asnake_config:
+            if 'default_config' in asnake_config['logging_config']:
+                default_logging_config = logging.configurations.get(
+                    asnake_config['logging_config']['default_config'])
+                del asnake_config['logging_config']['default_config']
+            else:
+                default_logging_config = None
+
+            logging.setup_logging(config = default_logging_config,
+                                  **asnake_config['logging_config'])
+
+        log = logging.get_logger(__name__)
+
+    return asnake_config
+
+def http_adapter(config):
+    '''Build a :class:`requests.adapters.HTTPAdapter` with the connection pool sizes and retry policy from config.
+
+Retries (if `max_retries` is more than 0) apply to connection errors and to responses with any of
+the `retry_status_codes`, waiting `retry_backoff_factor * 2 ** (retry number - 1)` seconds between
+attempts, or as long as a Retry-After header asks.  Only `retry_methods` are retried, which by
+default leaves out POST, since ArchivesSpace uses it for creating as well as updating records.'''
+    if not config['max_retries']:
+        # requests' own default, which unlike Retry(total=0) lets read timeouts raise ReadTimeout
+        return HTTPAdapter(pool_connections=config['pool_connections'],
+                           pool_maxsize=config['pool_maxsize'],
+                           max_retries=0)
+
+    retry_options = dict(total=config['max_retries'],
+                         backoff_factor=config['retry_backoff_factor'],
+                         status_forcelist=config['retry_status_codes'],
+                         raise_on_status=False)
+    try:
+        retries = Retry(allowed_methods=frozenset(config['retry_methods']), **retry_options)
+    except TypeError: # urllib3 < 1.26
+        retries = Retry(method_whitelist=frozenset(config['retry_methods']), **retry_options)
+
+    return HTTPAdapter(pool_connections=config['pool_connections'],
+                       pool_maxsize=config['pool_maxsize'],
+                       max_retries=retries)
+
 def http_meth_factory(meth):
     '''Utility method for producing HTTP proxy methods for ASnakeProxyMethods mixin class.
 
     Urls are prefixed with the value of baseurl from the client's ASnakeConfig.  Arguments are
-    passed unaltered to the matching requests.Session method.'''
+    passed unaltered to the matching requests.Session method.
+
+    If the client has a response cache, GETs are answered from it where possible, and
+    POST, PUT or DELETE requests invalidate cached responses for the URI they're sent to,
+    as well as any object for that URI in the client's identity map, and any indexed tree
+    or resource index the change might affect (see :func:`drop_tree_indexes` and
+    :func:`changes_resource_index`).
+
+    Requests wait on the client's :class:`asnake.client.ratelimit.RateLimiter` before being sent.
+    JSON request and response bodies are encoded and decoded with :mod:`asnake.jsonlib`.'''
     def http_method(self, url, *args, **kwargs):
-        # aspace uses the PHP convention where array-typed form values use names with '[]' appended
         if 'params' in kwargs:
-            kwargs['params'] = {k + '[]' if listlike_seq(v) and k[-2:] != '[]' else k:v for k,v in kwargs['params'].items()}
+            kwargs['params'] = php_params(kwargs['params'])
 
         full_url = "/".join([self.config['baseurl'].rstrip("/"), url.lstrip("/")])
-        result = getattr(self.session, meth)(full_url, *args, **kwargs)
-        if result.status_code == 403 and self.config['retry_with_auth']:
-            self.authorize()
+
+        # only plain GETs are answered from cache, anything fancier (streaming, custom headers) goes through
+        cacheable = meth == 'get' and self.cache and set(kwargs) <= {'params'} and not args
+        if cacheable:
+            cached = self.cache.get(full_url, kwargs.get('params'))
+            if cached:
+                log.debug("cached http method", method=meth.upper(), url=full_url, status=cached.status_code)
+                return jsonlib.install(cached)
+
+        body = kwargs.get('json')
+        kwargs = jsonlib.encode_body(kwargs)
+
+        sent_token = self.session.headers.get(self.config['session_header_name'])
+        with self.rate_limiter:
             result = getattr(self.session, meth)(full_url, *args, **kwargs)
+        self.rate_limiter.update(result)
+        if result.status_code == 403 and self.config['retry_with_auth']:
+            self.reauthorize(sent_token)
+            with self.rate_limiter:
+                result = getattr(self.session, meth)(full_url, *args, **kwargs)
+            self.rate_limiter.update(result)
         log.debug("proxied http method", method=meth.upper(), url=full_url, status=result.status_code)
+        jsonlib.install(result)
+
+        if cacheable:
+            self.cache.store(url, full_url, kwargs.get('params'), result)
+        elif meth in {'post', 'put', 'delete'}:
+            if self.cache:
+                self.cache.invalidate(full_url)
+            if self.identity_map is not None:
+                self.identity_map.pop("/" + url.strip("/"), None)
+            if self.tree_indexes:
+                drop_tree_indexes(self.tree_indexes, url, body)
+            if self.resource_index is not None and changes_resource_index(meth, url):
+                self.resource_index = None
         return result
     return http_method
 
@@ -49,40 +220,32 @@ class ASnakeProxyMethods(type):
             setattr(cls, meth, fn)
 
 class ASnakeClient(metaclass=ASnakeProxyMethods):
-    '''ArchivesSnake Web Client'''
-
-    def __init__(self, **config):
-        global log
-
-        if 'config_file' in config:
-            self.config = conf.ASnakeConfig(config['config_file'])
-        else:
-            self.config = conf.ASnakeConfig()
-
-        self.config.update(config)
-
-        # Only a subset of logging config can be supported in config
-        # For more complex setups (configuring output format, say),
-        # configure logs in Python code prior to loading
-        #
-        # Properties supported are:
-        #    filename, filemode, level, and default_config
-        # Default config can be any of the default configurations exposed in logging
-        if not log:
-            if not logging.already_configured and 'logging_config' in self.config:
-                if 'default_config' in self.config['logging_config']:
-                    default_logging_config = logging.configurations.get(
-                        self.config['logging_config']['default_config'])
-                    del self.config['logging_config']['default_config']
-                else:
-                    default_logging_config = None
-
-                logging.setup_logging(config = default_logging_config,
-                                      **self.config['logging_config'])
+    '''ArchivesSnake Web Client
 
-            log = logging.get_logger(__name__)
+A single client can safely be shared by many threads: authorization, the response cache,
+the identity map and the rate limiter are all shared and thread-safe, and expired sessions are
+re-authorized only once (see :meth:`reauthorize`).'''
 
-        if not hasattr(self, 'session'): self.session = Session()
+    def __init__(self, **config):
+        self.config = load_config(config)
+        self.cache = ResponseCache.from_config(self.config['cache'])
+        self.rate_limiter = RateLimiter.from_config(self.config)
+        self.auth_lock = RLock()
+
+        # JSONModelObjects loaded through this client, by uri, so that refs can be reified without refetching
+        self.identity_map = LRU(max_size=self.config['identity_map_size']) if self.config['identity_map_size'] else None
+        # asnake.jsonmodel.TreeIndex of resource trees, by resource uri, so components can find their place without refetching
+        self.tree_indexes = LRU(max_size=self.config['tree_index_size']) if self.config['tree_index_size'] else None
+        # asnake.jsonmodel.ResourceIndex, saying which repository each resource is in
+        self.resource_index = None
+        # what routes below records return, by (jsonmodel_type, attribute), see asnake.jsonmodel.route_kind
+        self.learned_routes = {}
+
+        if not hasattr(self, 'session'):
+            self.session = Session()
+            adapter = http_adapter(self.config)
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
         self.session.headers.update({'Accept': 'application/json',
                                      'User-Agent': 'ArchivesSnake/0.1'})
         log.debug("client created")
@@ -105,36 +268,55 @@ class ASnakeClient(metaclass=ASnakeProxyMethods):
 
         session_header_name = session_header_name or self.config['session_header_name']
 
-        # If we have a session_token already
-        if session_token:
-            self.session.headers[session_header_name] = session_token
-            log.debug("setting session token directly")
-            return session_token
-
-        # Otherwise, use ASpace login to get one
-
-
-
-        log.debug("authorizing against ArchivesSpace", user=username)
-
-        resp = self.session.post(
-            "/".join([self.config['baseurl'].rstrip("/"), 'users/{username}/login']).format(username=quote(username)),
-            data={"password": password, "expiring": False}
-        )
-
-        if resp.status_code != 200:
-            log.debug("authorization failure", status=resp.status_code)
-            raise ASnakeAuthError("Failed to authorize ASnake with status: {}".format(resp.status_code))
-        else:
-            session_token = json.loads(resp.text)['session']
-            self.session.headers[session_header_name] = session_token
-            log.debug("authorization success", session_token=session_token)
-            return session_token
-
-
-    def get_paged(self, url, *args, page_size=100, **kwargs):
-        '''get list of json objects from urls of paged items'''
+        # Serialized so that concurrent re-authorizations can't clobber each other's tokens
+        with self.auth_lock:
+            # If we have a session_token already
+            if session_token:
+                self.session.headers[session_header_name] = session_token
+                log.debug("setting session token directly")
+                return session_token
+
+            # Otherwise, use ASpace login to get one
+            log.debug("authorizing against ArchivesSpace", user=username)
+
+            resp = self.session.post(
+                "/".join([self.config['baseurl'].rstrip("/"), 'users/{username}/login']).format(username=quote(username)),
+                data={"password": password, "expiring": False}
+            )
+
+            if resp.status_code != 200:
+                log.debug("authorization failure", status=resp.status_code)
+                raise ASnakeAuthError("Failed to authorize ASnake with status: {}".format(resp.status_code))
+            else:
+                session_token = json.loads(resp.text)['session']
+                self.session.headers[session_header_name] = session_token
+                log.debug("authorization success", session_token=session_token)
+                return session_token
+
+    def reauthorize(self, stale_token):
+        '''Re-authorize after a request sent with `stale_token` was refused, once across all threads.
+
+If several threads sharing this client find their session has expired at the same time, only the
+first logs in again; the rest wait for it, then reuse the new token rather than logging in themselves.'''
+        with self.auth_lock:
+            current_token = self.session.headers.get(self.config['session_header_name'])
+            if current_token is not None and current_token != stale_token:
+                return current_token
+            return self.authorize()
+
+
+    def get_paged(self, url, *args, page_size=100, workers=None, **kwargs):
+        '''get list of json objects from urls of paged items
+
+If `workers` (or the `paged_workers` config value) is greater than 1, then once the first page
+shows how many pages there are, the remaining pages are fetched concurrently with a pool of
+that many threads.  Results are still yielded in page order.  Routes that return a bare list
+of ids (e.g. with `all_ids`) are expanded with :meth:`get_by_ids`, using the same workers.
+
+If the `stream_json` config value is set, pages are requested as streams and each result is
+yielded as soon as it's parsed, see :mod:`asnake.client.streaming`.'''
         params = {}
+        workers = workers or self.config['paged_workers']
 
         if "params" in kwargs:
             params.update(**kwargs['params'])
@@ -146,11 +328,27 @@ class ASnakeClient(metaclass=ASnakeProxyMethods):
 
         params.update(page_size=page_size, page=1)
 
+        if self.config['stream_json']:
+            yield from self._get_paged_streaming(url, params, workers, **kwargs)
+            return
+
         current_page = self.get(url, params=params, **kwargs)
         current_json = current_page.json()
         # Regular paged object
         if hasattr(current_json, 'keys') and \
            {'results', 'this_page', 'last_page'} <= set(current_json.keys()):
+            if workers > 1:
+                yield from current_json['results']
+
+                def fetch_page(page):
+                    return self.get(url, params=dict(params, page=page)).json()['results']
+
+                for results in bounded_map(fetch_page,
+                                           range(current_json['this_page'] + 1, current_json['last_page'] + 1),
+                                           workers=workers):
+                    yield from results
+                return
+
             while current_json['this_page'] <= current_json['last_page']:
                 for obj in current_json['results']:
                     yield obj
@@ -166,9 +364,163 @@ class ASnakeClient(metaclass=ASnakeProxyMethods):
                     for obj in current_json:
                         yield obj
                 elif isinstance(current_json[0], Number):
-                    for i in current_json:
-                        yield self.get("/".join([url, str(i)])).json()
+                    yield from self.get_by_ids(url, current_json, workers=workers)
                 else:
                     raise ASnakeWeirdReturnError("get_paged doesn't know how to handle {}".format(current_json))
         else:
             raise ASnakeWeirdReturnError("get_paged doesn't know how to handle {}".format(current_json))
+
+    def _get_paged_streaming(self, url, params, workers, **kwargs):
+        '''get_paged, for when the `stream_json` config value is set.'''
+        meta = {}
+        with self.get(url, params=params, stream=True, **kwargs) as response:
+            def results():
+                meta.update((yield from streaming.iter_items(response, 'results', '')))
+            items = results()
+            first = next(items, None)
+            if isinstance(first, Number):
+                # all_ids and friends, ids are small so it's fine to hold the response open while they're fetched
+                yield from self.get_by_ids(url, chain((first,), items), workers=workers)
+                return
+            elif first is not None:
+                if not hasattr(first, 'keys'):
+                    raise ASnakeWeirdReturnError("get_paged doesn't know how to handle {}".format(first))
+                yield first
+                yield from items
+
+        if not meta:
+            return # a bare list of objects
+        elif not {'this_page', 'last_page'} <= set(meta.keys()):
+            raise ASnakeWeirdReturnError("get_paged doesn't know how to handle {}".format(meta))
+
+        pages = range(meta['this_page'] + 1, meta['last_page'] + 1)
+        if workers > 1:
+            def fetch_page(page):
+                with self.get(url, params=dict(params, page=page), stream=True) as response:
+                    return list(streaming.iter_items(response, 'results'))
+
+            for results in bounded_map(fetch_page, pages, workers=workers):
+                yield from results
+            return
+
+        for page in pages:
+            with self.get(url, params=dict(params, page=page), stream=True) as response:
+                yield from streaming.iter_items(response, 'results')
+
+    def get_by_ids(self, url, ids, workers=None, batch_size=None):
+        '''get json objects with the given ids from an index route, in the order of ids.
+
+By default, each object is fetched from `url/:id`, concurrently if `workers` (or the `paged_workers`
+config value) is greater than 1.  If `batch_size` (or the `id_batch_size` config value) is set,
+objects are instead fetched `batch_size` at a time via the `id_set[]` parameter that
+ArchivesSpace's paginated index routes accept.  Ids that the server doesn't return are skipped.'''
+        workers = workers or self.config['paged_workers']
+        batch_size = batch_size or self.config['id_batch_size']
+
+        if not batch_size:
+            yield from bounded_map(lambda i: self.get("/".join([url, str(i)])).json(), ids, workers=workers)
+            return
+
+        def fetch_batch(batch):
+            result = self.get(url, params={"id_set": batch}).json()
+            if not isinstance(result, list):
+                raise ASnakeWeirdReturnError("id_set query to {} returned {}".format(url, result))
+            by_id = {int(obj['uri'].split('/')[-1]): obj for obj in result}
+            return [by_id[i] for i in batch if i in by_id]
+
+        ids = list(ids)
+        batches = (ids[start:start + batch_size] for start in range(0, len(ids), batch_size))
+        for objs in bounded_map(fetch_batch, batches, workers=workers):
+            yield from objs
+
+    def get_many(self, uris, workers=None, batch_size=None):
+        '''get json objects for many uris at once, returned as a dict of uri to json.
+
+Uris are grouped by the index route they belong to, and fetched `batch_size` (default: the
+`id_batch_size` config value, or 50) at a time via that route's `id_set[]` parameter.  Uris that
+can't be fetched that way, either because they don't end in an id or because the route doesn't
+accept `id_set[]`, are fetched individually.  Requests are made concurrently if `workers` (or the
+`paged_workers` config value) is greater than 1.  Uris that can't be fetched are left out.'''
+        workers = workers or self.config['paged_workers']
+        batch_size = batch_size or self.config['id_batch_size'] or 50
+
+        by_route = {}
+        singles = []
+        for uri in dict.fromkeys(uris):
+            route, _, last = uri.rstrip("/").rpartition("/")
+            if last.isdigit():
+                by_route.setdefault(route, []).append(int(last))
+            else:
+                singles.append(uri)
+
+        def fetch_batch(task):
+            route, batch = task
+            resp = self.get(route, params={"id_set": batch})
+            if resp.status_code == 200 and isinstance(resp.json(), list):
+                return {obj['uri']: obj for obj in resp.json()}, []
+            return {}, ["/".join((route, str(i),)) for i in batch]
+
+        def fetch_one(uri):
+            resp = self.get(uri)
+            return {uri: resp.json()} if resp.status_code == 200 else {}
+
+        results = {}
+        tasks = [(route, ids[start:start + batch_size]) for route, ids in by_route.items()
+                                                        for start in range(0, len(ids), batch_size)]
+        for found, failed in bounded_map(fetch_batch, tasks, workers=workers, ordered=False):
+            results.update(found)
+            singles.extend(failed)
+
+        for found in bounded_map(fetch_one, singles, workers=workers, ordered=False):
+            results.update(found)
+        return results
+
+    def bulk_post(self, items, workers=None, window=None, ordered=False):
+        '''POST many `(uri, json)` pairs concurrently, yielding a :class:`BulkResult` for each.
+
+Items are pulled from `items` only as there's room for them, so at most `window` (default: twice the
+number of workers) requests are pending at once, and `items` can be a generator over far more
+records than would fit in memory.  `workers` defaults to the `paged_workers` config value.
+Results are yielded as requests finish, unless `ordered` is True.  Failures, including
+:attr:`BulkResult.conflict` for records whose lock_version is stale, are reported rather than raised.
+
+.. code-block:: python
+
+    new_subjects = (('/subjects', JM.subject(title=t, source="local", terms=[...], vocabulary="/vocabularies/1")) for t in titles)
+    for result in client.bulk_post(new_subjects, workers=8):
+        if not result.ok:
+            print(result.uri, result.status_code or result.error)
+'''
+        def send(item):
+            uri, json_rep = item
+            return self._bulk_send(uri, json_rep)
+
+        yield from bounded_map(send, items, workers=workers or self.config['paged_workers'],
+                               window=window, ordered=ordered)
+
+    def _bulk_send(self, uri, json_rep):
+        try:
+            return BulkResult(uri, json_rep, self.post(uri, json=json_rep))
+        except Exception as e:
+            log.debug("bulk post failed", uri=uri, error=repr(e))
+            return BulkResult(uri, json_rep, error=e)
+
+    def bulk_update(self, records, workers=None, window=None, ordered=False):
+        '''Update many records concurrently, yielding a :class:`BulkResult` for each.
+
+Records can be dicts with a `uri` key (e.g. edited :meth:`asnake.jsonmodel.JSONModelObject.json`
+results) or anything responding to `.json()` with such a dict.  Each is POSTed back to its own uri,
+as for :meth:`bulk_post`.  A record without a `uri` is reported as a failed result with
+no uri, rather than stopping the others being sent.'''
+        def send(record):
+            json_rep = record
+            try:
+                json_rep = record.json() if callable(getattr(record, 'json', None)) else record
+                uri = json_rep['uri']
+            except Exception as e:
+                log.debug("bulk update record unusable", error=repr(e))
+                return BulkResult(None, json_rep, error=e)
+            return self._bulk_send(uri, json_rep)
+
+        return bounded_map(send, records, workers=workers or self.config['paged_workers'],
+                           window=window, ordered=ordered)
@@ -0,0 +1,193 @@
+'''Helpers for running a bounded number of calls against ArchivesSpace at once.
+
+These are thin wrappers over :class:`concurrent.futures.ThreadPoolExecutor` and asyncio tasks,
+which keep a limited number of calls in flight, so that walking a very large collection doesn't
+queue up every request (and every response) in memory at once.  :func:`merge_iterables` reads
+several collections (e.g. the resources of each repository) at once and merges what they return.'''
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
+from itertools import islice, chain
+from queue import Queue, Full
+from threading import Event
+import asyncio
+
+# markers for what merge_iterables' threads and tasks put on their queues
+_item, _done, _error = object(), object(), object()
+
+def bounded_map(fn, iterable, workers=1, window=None, ordered=True):
+    '''Like :func:`map`, but calls `fn` on items from `iterable` with a pool of `workers` threads.
+
+At most `window` calls (default: twice the number of workers) are in flight at any one time.
+If `ordered` is True, results are yielded in the same order as the items they came from,
+otherwise they are yielded as they complete.
+
+With one worker or fewer, this is just a lazy serial map, and no threads are created.'''
+    if not workers or workers <= 1:
+        yield from map(fn, iterable)
+        return
+
+    window = max(window or workers * 2, 1)
+    items = iter(iterable)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque(pool.submit(fn, item) for item in islice(items, window))
+        try:
+            while pending:
+                if ordered:
+                    done = [pending.popleft()]
+                else:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    done = [f for f in pending if f in finished]
+                    for f in done: pending.remove(f)
+
+                for future in done:
+                    yield future.result()
+                    pending.extend(pool.submit(fn, item) for item in islice(items, 1))
+        finally:
+            # caller stopped early or a call raised, don't do work nobody will see
+            for future in pending:
+                future.cancel()
+
+async def async_bounded_map(fn, iterable, workers=1, window=None, ordered=True):
+    '''Async counterpart to :func:`bounded_map`, for a coroutine function `fn`.
+
+At most `workers` calls run at once, and at most `window` (default: twice the number of workers)
+are scheduled at any one time.  Must be iterated with `async for`.'''
+    if not workers or workers <= 1:
+        for item in iterable:
+            yield await fn(item)
+        return
+
+    window = max(window or workers * 2, 1)
+    semaphore = asyncio.Semaphore(workers)
+    async def call(item):
+        async with semaphore:
+            return await fn(item)
+
+    items = iter(iterable)
+    pending = deque(asyncio.ensure_future(call(item)) for item in islice(items, window))
+    try:
+        while pending:
+            if ordered:
+                done = [pending.popleft()]
+            else:
+                finished, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                done = [t for t in pending if t in finished]
+                for t in done: pending.remove(t)
+
+            for task in done:
+                yield await task
+                pending.extend(asyncio.ensure_future(call(item)) for item in islice(items, 1))
+    finally:
+        for task in pending:
+            task.cancel()
+
+def merge_iterables(iterables, workers=None, ordered=False, buffer=100):
+    '''Iterate over several iterables at once, each drained by one of a pool of `workers` threads
+(default: one per iterable).
+
+If `ordered` is False, items are yielded as soon as any iterable produces them, though the items
+from each iterable stay in order.  Otherwise, all of the first iterable's items are yielded, then
+all of the second's and so on, as with :func:`itertools.chain`, while the others are read ahead.
+At most `buffer` items read ahead from each iterable are held at once.
+
+With one worker or fewer, or only one iterable, this is just :func:`itertools.chain`, and no
+threads are created.'''
+    iterables = list(iterables)
+    workers = len(iterables) if workers is None else workers
+    if workers <= 1 or len(iterables) <= 1:
+        yield from chain.from_iterable(iterables)
+        return
+
+    stopped = Event()
+    if ordered:
+        queues = [Queue(maxsize=buffer) for _ in iterables]
+    else:
+        queues = [Queue(maxsize=buffer * len(iterables))] * len(iterables)
+
+    def put(queue, entry):
+        while not stopped.is_set():
+            try:
+                queue.put(entry, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def drain(iterable, queue):
+        items = iter(iterable)
+        try:
+            for item in items:
+                if not put(queue, (_item, item)):
+                    return
+            put(queue, (_done, None))
+        except BaseException as e:
+            put(queue, (_error, e))
+        finally:
+            # e.g. so get_paged stops fetching pages when abandoned
+            if hasattr(items, 'close'):
+                items.close()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(drain, iterable, queue) for iterable, queue in zip(iterables, queues)]
+        try:
+            remaining = len(iterables)
+            current = 0
+            while remaining:
+                kind, value = queues[current].get()
+                if kind is _item:
+                    yield value
+                elif kind is _error:
+                    raise value
+                else:
+                    remaining -= 1
+                    if ordered:
+                        current += 1
+        finally:
+            # caller stopped early or an iterable raised, let the other threads give up
+            stopped.set()
+            for future in futures:
+                future.cancel()
+
+async def async_merge_iterables(iterables, ordered=False, buffer=100):
+    '''Async counterpart to :func:`merge_iterables`, for async iterables, each drained by its own task.
+
+Must be iterated with `async for`.'''
+    iterables = list(iterables)
+    if len(iterables) <= 1:
+        for iterable in iterables:
+            async for item in iterable:
+                yield item
+        return
+
+    if ordered:
+        queues = [asyncio.Queue(maxsize=buffer) for _ in iterables]
+    else:
+        queues = [asyncio.Queue(maxsize=buffer * len(iterables))] * len(iterables)
+
+    async def drain(iterable, queue):
+        try:
+            async for item in iterable:
+                await queue.put((_item, item))
+            await queue.put((_done, None))
+        except asyncio.CancelledError:
+            raise
+        except BaseException as e:
+            await queue.put((_error, e))
+
+    tasks = [asyncio.ensure_future(drain(iterable, queue)) for iterable, queue in zip(iterables, queues)]
+    try:
+        remaining = len(iterables)
+        current = 0
+        while remaining:
+            kind, value = await queues[current].get()
+            if kind is _item:
+                yield value
+            elif kind is _error:
+                raise value
+            else:
+                remaining -= 1
+                if ordered:
+                    current += 1
+    finally:
+        for task in tasks:
+            task.cancel()
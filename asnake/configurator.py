@@ -18,6 +18,26 @@ def ConfigSources(yaml_path):
         'password'        : 'admin',
         'session_header_name': 'X-ArchivesSpace-Session',
         'retry_with_auth' : True,
+        'paged_workers'   : 1,
+        'id_batch_size'   : None,
+        'cache'           : None,
+        'identity_map_size': None,
+        'pool_connections': 10,
+        'pool_maxsize'    : 10,
+        'max_retries'     : 0,
+        'retry_backoff_factor': 0.5,
+        'retry_status_codes': [429, 500, 502, 503, 504],
+        'retry_methods'   : ['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'],
+        'rate_limit'      : None,
+        'rate_limit_burst': None,
+        'rate_limit_adaptive': True,
+        'max_concurrent_requests': None,
+        'stream_json'     : False,
+        'json_backend'    : None,
+        'lazy_search_results': False,
+        'tree_index_size' : None,
+        'tree_index_ttl'  : 300,
+        'resource_index_ttl': 300,
 
     })
 
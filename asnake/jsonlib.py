@@ -0,0 +1,185 @@
+'''JSON decoding and encoding for ArchivesSnake, with the fastest library available.
+
+`orjson <https://pypi.org/project/orjson/>`_ is used if it's installed, then
+`ujson <https://pypi.org/project/ujson/>`_, and otherwise the standard library's :mod:`json`.
+Neither of the faster libraries is installed by default; install one directly, or orjson via the
+`fast` extra (`pip install ArchivesSnake[fast]`).
+
+The backend is shared by the whole process.  It can be picked with the `json_backend` config value
+(one of `orjson`, `ujson` or `json`), or by calling :func:`use`.
+
+Clients use the backend for response bodies (via :func:`install` on each response) and for
+bodies sent with the `json` argument, and the abstraction layer for the `json` field of
+search results.  Anything the faster libraries can't handle is passed on to :mod:`json`.
+
+It also provides read-only views of decoded JSON (see :func:`frozen`), which
+:meth:`asnake.jsonmodel.JSONModelObject.json` returns when asked not to copy.'''
+from collections.abc import Mapping, Sequence
+from copy import deepcopy
+from functools import partial
+
+import attr
+import json
+
+@attr.s(slots=True, frozen=True)
+class JSONBackend:
+    '''A JSON library: `loads` takes str or bytes, `dumps` returns UTF-8 encoded bytes.'''
+    name = attr.ib()
+    loads = attr.ib()
+    dumps = attr.ib()
+
+def _orjson():
+    import orjson
+    return JSONBackend('orjson', orjson.loads, orjson.dumps)
+
+def _ujson():
+    import ujson
+    return JSONBackend('ujson', ujson.loads,
+                       lambda obj: ujson.dumps(obj, escape_forward_slashes=False).encode('utf8'))
+
+def _json():
+    return JSONBackend('json', json.loads, lambda obj: json.dumps(obj).encode('utf8'))
+
+# in order of preference
+backends = {
+    'orjson': _orjson,
+    'ujson': _ujson,
+    'json': _json,
+}
+
+stdlib = _json()
+backend = None
+
+def use(name=None):
+    '''Switch to the named backend, or to the fastest one installed if `name` is None.
+
+Raises ImportError if the named backend isn't installed.'''
+    global backend
+    if name is not None:
+        if name not in backends:
+            raise ValueError("Unknown JSON backend '{}', expected one of: {}".format(name, ", ".join(backends)))
+        backend = backends[name]()
+        return backend
+
+    for make_backend in backends.values():
+        try:
+            backend = make_backend()
+            return backend
+        except ImportError:
+            pass
+
+use()
+
+def loads(s):
+    '''Decode JSON from str or bytes.'''
+    return backend.loads(s)
+
+def dumps(obj):
+    '''Encode obj as JSON, returned as UTF-8 encoded bytes.'''
+    try:
+        return backend.dumps(obj)
+    except (TypeError, OverflowError):
+        # e.g. orjson refuses non-str keys, ints over 64 bits and frozen views, which json copes with
+        return json.dumps(obj, default=_unfreeze).encode('utf8')
+
+def _unfreeze(obj):
+    if isinstance(obj, (FrozenMapping, FrozenSequence)):
+        return obj._data
+    raise TypeError("Object of type {} is not JSON serializable".format(type(obj).__name__))
+
+def response_json(response, **kwargs):
+    '''Decode a requests or httpx response's body with the current backend.
+
+Falls back to the response's own `json` method (with its usual errors) when given keyword
+arguments for :func:`json.loads`, or if the body can't be decoded.'''
+    if kwargs or backend.name == 'json':
+        return type(response).json(response, **kwargs)
+    try:
+        return backend.loads(response.content)
+    except ValueError:
+        return type(response).json(response)
+
+def install(response):
+    '''Make response's `json` method decode with the current backend, returning response.'''
+    response.json = partial(response_json, response)
+    return response
+
+def encode_body(kwargs, body_arg='data'):
+    '''Replace a `json` argument in a request's kwargs with a body encoded by the current backend.
+
+`body_arg` is the argument to pass the body as, `data` for requests and `content` for httpx.'''
+    if kwargs.get('json') is None:
+        return kwargs
+    kwargs = dict(kwargs)
+    kwargs[body_arg] = dumps(kwargs.pop('json'))
+    headers = dict(kwargs.get('headers') or {})
+    if not any(k.lower() == 'content-type' for k in headers):
+        headers['Content-Type'] = 'application/json'
+    kwargs['headers'] = headers
+    return kwargs
+
+def frozen(obj):
+    '''Return a read-only view of decoded JSON, which shares obj's data rather than copying it.
+
+Dicts are viewed as :class:`FrozenMapping`, lists as :class:`FrozenSequence`, and anything else is
+returned as it is.  Nested dicts and lists are viewed in turn as they're accessed, so making a view
+costs the same however big obj is.'''
+    if type(obj) is dict:
+        return FrozenMapping(obj)
+    if type(obj) is list:
+        return FrozenSequence(obj)
+    return obj
+
+class FrozenMapping(Mapping):
+    '''Read-only view of a JSON object, see :func:`frozen`.  Use :meth:`copy` for an editable copy.'''
+    __slots__ = ('_data',)
+
+    def __init__(self, data):
+        self._data = data
+
+    def __getitem__(self, key):
+        return frozen(self._data[key])
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __eq__(self, other):
+        return self._data == (other._data if isinstance(other, FrozenMapping) else other)
+
+    def __repr__(self):
+        return repr(self._data)
+
+    def copy(self):
+        '''Return an editable deep copy of the underlying dict.'''
+        return deepcopy(self._data)
+
+class FrozenSequence(Sequence):
+    '''Read-only view of a JSON array, see :func:`frozen`.  Use :meth:`copy` for an editable copy.'''
+    __slots__ = ('_data',)
+
+    def __init__(self, data):
+        self._data = data
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return FrozenSequence(self._data[index])
+        return frozen(self._data[index])
+
+    def __len__(self):
+        return len(self._data)
+
+    def __eq__(self, other):
+        return self._data == (other._data if isinstance(other, FrozenSequence) else other)
+
+    def __repr__(self):
+        return repr(self._data)
+
+    def copy(self):
+        '''Return an editable deep copy of the underlying list.'''
+        return deepcopy(self._data)
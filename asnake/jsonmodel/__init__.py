@@ -2,10 +2,14 @@ from itertools import chain
 from more_itertools import flatten
 from copy import deepcopy
 from collections.abc import Sequence
+from time import monotonic
 
 import json
+import asnake.jsonlib as jsonlib
 import re
 from asnake.logging import get_logger
+from asnake.concurrency import bounded_map, merge_iterables
+from asnake.client import streaming
 
 component_signifiers = frozenset({"archival_object", "archival_objects"})
 jmtype_signifiers = frozenset({"ref", "jsonmodel_type"})
@@ -16,6 +20,80 @@ solr_route_regexes = [
     re.compile(r'/?repositories/\d+/top_containers/search/?')
 ]
 
+#: Routes below records of each jsonmodel_type, by attribute name, and what they return: `object`
+#: for a single object, fetched when the attribute is accessed, or `relation` for a collection,
+#: returned as a :class:`JSONModelRelation` without any request.  `missing` marks attributes that are
+#: never routes, which raise AttributeError without a request when they aren't in a record's JSON.
+#: Optional schema fields of the common record types are marked `missing`, so that reading one a
+#: record doesn't have (e.g. `component_id`) doesn't cost a request.
+known_routes = {
+    'repository': dict.fromkeys(('accessions', 'archival_objects', 'assessments', 'classifications',
+                                 'classification_terms', 'digital_objects', 'digital_object_components',
+                                 'events', 'groups', 'jobs', 'resources', 'search', 'top_containers',),
+                                'relation'),
+    'resource': {'tree': 'object', 'ordered_records': 'object'},
+    'digital_object': {'tree': 'object'},
+    'classification': {'tree': 'object'},
+}
+
+# Fields shared by archival records (and none of the GET routes below them, like `children`,
+# `previous` or `top_containers`)
+_record_fields = ('ark_name', 'dates', 'display_string', 'external_documents', 'external_ids',
+                  'extents', 'import_previous_arks', 'is_slug_auto', 'lang_materials', 'linked_agents',
+                  'linked_events', 'metadata_rights_declarations', 'notes', 'publish',
+                  'repository_processing_note', 'restrictions_apply', 'rights_statements', 'slug',
+                  'subjects', 'suppressed', 'title',)
+_identifier_fields = ('id_0', 'id_1', 'id_2', 'id_3',)
+_never_routes = {
+    'archival_object': _record_fields + ('accession_links', 'ancestors', 'component_id',
+                                         'has_unpublished_ancestor', 'instances', 'level', 'other_level',
+                                         'parent', 'position', 'ref_id', 'representative_file_version',
+                                         'resource', 'series',),
+    'resource': _record_fields + _identifier_fields + (
+        'classifications', 'collection_management', 'deaccessions', 'ead_id', 'ead_location',
+        'finding_aid_author', 'finding_aid_date', 'finding_aid_description_rules',
+        'finding_aid_edition_statement', 'finding_aid_filing_title', 'finding_aid_language',
+        'finding_aid_language_note', 'finding_aid_note', 'finding_aid_script',
+        'finding_aid_series_statement', 'finding_aid_sponsor', 'finding_aid_status',
+        'finding_aid_subtitle', 'finding_aid_title', 'instances', 'level', 'other_level',
+        'related_accessions', 'representative_file_version', 'resource_type', 'revision_statements',
+        'user_defined',),
+    'accession': _record_fields + _identifier_fields + (
+        'access_restrictions', 'access_restrictions_note', 'accession_date', 'acquisition_type',
+        'classifications', 'collection_management', 'condition_description', 'content_description',
+        'deaccessions', 'disposition', 'general_note', 'instances', 'inventory', 'material_types',
+        'payment_summary', 'provenance', 'related_accessions', 'related_resources', 'resource_type',
+        'retention_rule', 'use_restrictions', 'use_restrictions_note', 'user_defined',),
+    'digital_object': _record_fields + ('classifications', 'collection_management', 'digital_object_id',
+                                        'digital_object_type', 'file_versions', 'level',
+                                        'representative_file_version', 'user_defined',),
+    'digital_object_component': _record_fields + ('component_id', 'digital_object', 'file_versions',
+                                                  'has_unpublished_ancestor', 'label', 'parent',
+                                                  'position', 'representative_file_version',),
+}
+known_routes.update({jsonmodel_type: dict(dict.fromkeys(fields, 'missing'), **known_routes.get(jsonmodel_type, {}))
+                     for jsonmodel_type, fields in _never_routes.items()})
+
+def route_kind(client, jsonmodel_type, key):
+    '''What the route `key` below a record of jsonmodel_type returns, as in :data:`known_routes`, or
+`missing` if there's no such route.  Returns None if that isn't known yet.
+
+Routes not in :data:`known_routes` are learned by each client (in its `learned_routes`) the first
+time they're found on a record of that type.  Routes that turn out not to exist aren't learned, since
+some only exist for some records.'''
+    kind = known_routes.get(jsonmodel_type, {}).get(key)
+    if kind is None:
+        learned_routes = getattr(client, 'learned_routes', None)
+        if learned_routes:
+            kind = learned_routes.get((jsonmodel_type, key))
+    return kind
+
+def learn_route(client, jsonmodel_type, key, kind):
+    '''Remember what the route `key` below records of jsonmodel_type returns, see :func:`route_kind`.'''
+    learned_routes = getattr(client, 'learned_routes', None)
+    if learned_routes is not None and jsonmodel_type is not None:
+        learned_routes[(jsonmodel_type, key)] = kind
+
 def dispatch_type(obj):
     '''Determines if object is JSON suitable for wrapping with a JSONModelObject, or a narrower subtype.
 Returns either the correct class or False if no class is suitable.
@@ -39,40 +117,119 @@ is fine and expected, but the following is dangerous:
         return jmtype(obj, self.client)
 
 because it will break on wrapped or otherwise odd objects.'''
+    return classify(obj)[0]
+
+def classify(obj):
+    '''Classify obj in a single pass, returning `(jmtype, json)`.
+
+`jmtype` is as returned by :func:`dispatch_type`, and `json` is obj itself, or for search results,
+the record decoded from their `json` field, so that nothing needs to be decoded or scanned twice.
+Objects that are already wrapped are classified as their own type.'''
+    if type(obj) is not dict:
+        if isinstance(obj, JSONModelObject):
+            return type(obj), obj
+        if not isinstance(obj, dict):
+            return False, obj
+
+    keys = obj.keys()
+    # Handle wrapped objects returned by searches
+    if keys >= searchdoc_signifiers:
+        obj = jsonlib.loads(obj['json'])
+        keys = obj.keys()
+
+    ref = obj.get('ref')
+    ref_type = _ref_type(ref) if ref is not None else None
+    if obj.get("jsonmodel_type", ref_type) in component_signifiers:
+        if keys >= node_data_signifiers:
+            return TreeNodeData, obj
+        return ComponentObject, obj
+    elif not keys.isdisjoint(node_signifiers) or ref_type == "tree":
+        return TreeNode, obj
+    elif not keys.isdisjoint(jmtype_signifiers):
+        return JSONModelObject, obj
+    return False, obj
+
+def _ref_type(ref):
+    '''Last non-numeric segment of a ref, e.g. `archival_objects` for `/repositories/2/archival_objects/1`.'''
+    head, _, last = ref.rpartition("/")
+    if last.isdigit():
+        last = head.rpartition("/")[2]
+    if last and not last.isdigit():
+        return last
+    return next((x for x in reversed(ref.split("/")) if x and not x.isdigit()), None)
 
-    value = False
-    if isinstance(obj, dict):
-        # Handle wrapped objects returned by searches
-        if searchdoc_signifiers.issubset(set(obj)):
-            obj = json.loads(obj['json'])
+def wrap_json_object(obj, client=None):
+    '''Classify object, and either wrap it in the correct JSONModel type or return it as is.
 
-        ref_type = [x for x in obj['ref'].split("/") if not x.isdigit()][-1] if 'ref' in obj else None
-        if obj.get("jsonmodel_type", ref_type) in component_signifiers:
-            if node_data_signifiers.issubset(set(obj)):
-                return TreeNodeData
-            else:
-                value = ComponentObject
-        elif node_signifiers.intersection(obj.keys()) or ref_type == "tree":
-            value = TreeNode
-        elif jmtype_signifiers.intersection(obj.keys()):
-            value = JSONModelObject
+Prefer this STRONGLY to directly using the output of :func:`dispatch_type`
+
+If the `lazy_search_results` config value is set, search results are wrapped without decoding
+the record in their `json` field, see :class:`LazySearchResult`.'''
+    if type(obj) is dict and obj.keys() >= searchdoc_signifiers:
+        client = client or JSONModelObject.default_client()
+        if client.config['lazy_search_results']:
+            return wrap_search_doc(obj, client)
+    jmtype, obj = classify(obj)
+    # objects that are already wrapped are classified as their own type
+    if jmtype and type(obj) is not jmtype:
+        obj = jmtype(obj, client)
+    return obj
 
-    return value
+def reify_many(objs, workers=None, batch_size=None):
+    '''Reify many :class:`JSONModelObject` refs at once, rather than with one request per ref.
 
-def wrap_json_object(obj, client=None):
-    '''Classify object, and either wrap it in the correct JSONModel type or return it as is.
+Refs are fetched in bulk with :meth:`asnake.client.web_client.ASnakeClient.get_many`, falling back
+to individual (possibly concurrent) requests where a route doesn't support that.  Anything in
+`objs` which isn't an unresolved ref is left alone.  Returns the list of objects passed in.
 
-Prefer this STRONGLY to directly using the output of :func:`dispatch_type`'''
-    if isinstance(obj, dict):
-        # Handle wrapped objects returned by searches
-        if searchdoc_signifiers.issubset(set(obj)):
-            obj = json.loads(obj['json'])
+.. code-block:: python
 
+    for agent in reify_many(ao.linked_agents):
+        print(agent.title)
+'''
+    objs = list(objs)
+    pending = {}
+    for obj in objs:
+        if not isinstance(obj, JSONModelObject) or not obj.is_ref:
+            continue
+        identity_map = getattr(obj._client, 'identity_map', None)
+        if '_resolved' in obj._json or (identity_map is not None and obj._json['ref'] in identity_map):
+            obj.reify()
+        else:
+            pending.setdefault(obj._client, {}).setdefault(obj._json['ref'], []).append(obj)
+
+    for client, refs in pending.items():
+        for uri, json_rep in client.get_many(refs.keys(), workers=workers, batch_size=batch_size).items():
+            for obj in refs.get(uri, ()):
+                obj._json = json_rep
+                obj.is_ref = False
+                obj._remember()
+    return objs
+
+def update_many(objs, mutator, workers=None, retries=3, ordered=False):
+    '''Call :meth:`JSONModelObject.update` with `mutator` on many objects concurrently.
+
+Yields a :class:`asnake.client.web_client.BulkResult` for each object, as for
+:meth:`asnake.client.web_client.ASnakeClient.bulk_post`, with the final JSON sent and either the
+response or the error that ended that object's update.  `workers` defaults to the `paged_workers`
+config value of the first object's client.'''
+    from asnake.client.web_client import BulkResult, ASnakeUpdateError
+    objs = iter(objs)
+    first = next(objs, None)
+    if first is None:
+        return
+
+    def update(obj):
+        try:
+            response = obj.update(mutator, retries=retries)
+            return BulkResult(obj._json['uri'], obj._json, response)
+        except ASnakeUpdateError as e:
+            return BulkResult(obj._json.get('uri'), obj._json, e.response, e)
+        except Exception as e:
+            return BulkResult(obj._json.get('uri', obj._json.get('ref')), obj._json, error=e)
 
-    jmtype = dispatch_type(obj)
-    if jmtype:
-        obj = jmtype(obj, client)
-    return obj
+    yield from bounded_map(update, chain((first,), objs), workers=workers or first._client.config['paged_workers'],
+                           ordered=ordered)
 
 def find_subtree(tree, uri):
     '''Navigates a tree object to get a list of children of a specified archival object uri.'''
@@ -88,6 +245,116 @@ def find_subtree(tree, uri):
             if subtree: break
     return subtree
 
+class TreeIndex:
+    '''The nodes of a resource's tree (as returned by its `/tree` route), by record_uri.
+
+Built in one pass over the tree, so that finding any node, or its parent, is a dict lookup rather
+than a search of the tree.  If `tree_index_size` is set, clients keep the indexes of that many
+resources, each for `tree_index_ttl` seconds (None for as long as the client lives), and forget an
+index as soon as a write through the client may have changed the tree.'''
+    __slots__ = ('resource_uri', 'nodes', 'parents', 'built')
+
+    def __init__(self, resource_uri, tree):
+        self.resource_uri = resource_uri
+        self.nodes = {}
+        self.parents = {}
+        self.built = monotonic()
+
+        stack = [(tree, None)]
+        while stack:
+            node, parent_uri = stack.pop()
+            uri = node['record_uri']
+            self.nodes[uri] = node
+            self.parents[uri] = parent_uri
+            stack.extend((child, uri) for child in node.get('children', ()))
+
+    def node(self, uri):
+        '''The JSON of the node for the record at uri, or None if it's not in the tree.'''
+        return self.nodes.get(uri)
+
+    def parent(self, uri):
+        '''The JSON of the parent of the node for the record at uri, or None if it's the root or not in the tree.'''
+        return self.nodes.get(self.parents.get(uri))
+
+    @classmethod
+    def cached(cls, client, resource_uri):
+        '''The index client is keeping for resource_uri, or None if it has none that's still fresh.'''
+        tree_indexes = getattr(client, 'tree_indexes', None)
+        if not tree_indexes:
+            return None
+        ttl = client.config['tree_index_ttl']
+        if ttl is not None:
+            # drop every expired index, not just this one, so stale trees aren't held until evicted
+            for uri, index in list(tree_indexes.items()):
+                if monotonic() - index.built >= ttl:
+                    tree_indexes.pop(uri, None)
+        return tree_indexes.get(resource_uri)
+
+    def keep(self, client):
+        '''Keep this index in client's `tree_indexes` if it has them, returning the index.'''
+        tree_indexes = getattr(client, 'tree_indexes', None)
+        if tree_indexes is not None:
+            tree_indexes[self.resource_uri] = self
+        return self
+
+def tree_index(client, resource_uri):
+    '''Return the :class:`TreeIndex` for the resource at resource_uri, fetching its tree only if the
+client isn't already keeping a fresh index of it.'''
+    index = TreeIndex.cached(client, resource_uri)
+    if index is None:
+        if client.config['stream_json']:
+            with client.get(resource_uri + '/tree', stream=True) as response:
+                tree = streaming.find_subtree(streaming.iter_tree(response), resource_uri)
+        else:
+            tree = client.get(resource_uri + '/tree').json()
+        index = TreeIndex(resource_uri, tree).keep(client)
+    return index
+
+class ResourceIndex:
+    '''Which repository each resource belongs to, by resource id, as used by :meth:`ResourceRelation.__call__`.
+
+Built from the `all_ids` list of every repository's resources, fetched with a pool of
+`paged_workers` threads.  Clients keep the index for `resource_index_ttl` seconds (None for as long
+as the client lives, 0 to not keep it), and forget it when a write through the client creates,
+deletes or transfers a resource, or changes the list of repositories.'''
+    __slots__ = ('repositories', 'owners', 'built')
+
+    def __init__(self, repositories, resource_ids):
+        '''`repositories` is a list of repository uris, `resource_ids` the list of resource ids in each.'''
+        self.repositories = repositories
+        self.owners = {}
+        for repo_uri, ids in zip(repositories, resource_ids):
+            self.owners.update(dict.fromkeys(ids, repo_uri))
+        self.built = monotonic()
+
+    @classmethod
+    def build(cls, client):
+        '''Fetch the resource ids of every repository and index them.'''
+        repo_uris = [r['uri'] for r in client.get('repositories').json()]
+        def ids(uri):
+            return client.get(uri + '/resources', params={'all_ids': True}).json()
+        return cls(repo_uris, list(bounded_map(ids, repo_uris, workers=client.config['paged_workers'])))
+
+    def owner(self, resource_id):
+        '''The uri of the repository holding the resource with id resource_id, or None if it wasn't indexed.'''
+        return self.owners.get(resource_id)
+
+    @classmethod
+    def cached(cls, client):
+        '''The index client is keeping, or None if it has none that's still fresh.'''
+        index = getattr(client, 'resource_index', None)
+        ttl = client.config['resource_index_ttl']
+        if index is not None and ttl is not None and monotonic() - index.built >= ttl:
+            client.resource_index = None
+            return None
+        return index
+
+    def keep(self, client):
+        '''Keep this index on client unless it's configured not to, returning the index.'''
+        if hasattr(client, 'resource_index') and client.config['resource_index_ttl'] != 0:
+            client.resource_index = self
+        return self
+
 
 # Base metaclass for shared functionality
 class JSONModel(type):
@@ -105,20 +372,41 @@ class JSONModel(type):
 
 # Classes dealing with JSONModel imports
 class JSONModelObject(metaclass=JSONModel):
-    '''A wrapper over the JSONModel representation of a single object in ArchivesSpace.'''
+    '''A wrapper over the JSONModel representation of a single object in ArchivesSpace.
+
+Wrappers have no per-instance `__dict__`, so that holding very many of them (e.g. refs) costs
+little more than the JSON itself; subclasses should declare `__slots__` too.'''
+    __slots__ = ('_json', '_client', 'is_ref', '__weakref__')
 
     def __init__(self, json_rep, client = None):
         self._json = json_rep
         self._client = client or type(self).default_client()
         self.is_ref = 'ref' in json_rep
+        if not self.is_ref:
+            self._remember()
+
+    def _remember(self):
+        '''Register this object in its client's identity map, if the client has one.'''
+        identity_map = getattr(self._client, 'identity_map', None)
+        if identity_map is not None and type(self) in identity_types and 'uri' in self._json:
+            identity_map[self._json['uri']] = self
 
     def reify(self):
-        '''Convert object from a ref into a realized object.'''
+        '''Convert object from a ref into a realized object.
+
+If the client has an identity map (see the `identity_map_size` config value) holding an
+already-loaded object for the ref, that object's JSON is reused rather than fetched again.'''
         if self.is_ref:
-            if '_resolved' in self._json:
+            identity_map = getattr(self._client, 'identity_map', None)
+            loaded = identity_map.get(self._json['ref']) if identity_map is not None else None
+            if loaded is not None:
+                self._json = loaded._json
+            elif '_resolved' in self._json:
                 self._json = self._json['_resolved']
+                self._remember()
             else:
                 self._json = self._client.get(self._json['ref']).json()
+                self._remember()
             self.is_ref = False
         return self
 
@@ -136,8 +424,7 @@ agents have unique ids per agent_type, not across all agents.'''
 
     def __dir__(self):
         self.reify()
-        return sorted(chain(self._json.keys(),
-                    (x for x in self.__dict__.keys() if not x.startswith("_{}__".format(type(self).__name__)))))
+        return sorted(set(chain(self._json.keys(), (x for x in dir(type(self)) if not x.startswith("_")))))
 
     def __repr__(self):
         result = "#<{}".format(self._json['jsonmodel_type'] if not self.is_ref else "ref" )
@@ -167,60 +454,205 @@ If neither is present, the method raises an AttributeError.'''
         if not key.startswith('_') and not key == 'is_ref':
             if (not key in self._json.keys()) and 'uri' in self._json:
                 uri = "/".join((self._json['uri'].rstrip("/"), key,))
+                jsonmodel_type = self._json.get('jsonmodel_type')
                 # Existence of route isn't enough, need to discriminate by type
                 # example: .../resources/:id/ordered_records which ALSO ought to be maybe treated as plural?
-                # This works, at the cost of a "wasted" full call if not a JSONModelObject
-                resp = self._client.get(uri, params={"all_ids":True})
+                # Unless the route registry already knows, this costs a "wasted" full call if not a JSONModelObject
+                kind = route_kind(self._client, jsonmodel_type, key)
+                if kind == 'missing':
+                    raise AttributeError("'{}' has no attribute or route named '{}'".format(repr(self), key))
+                if kind == 'relation':
+                    return self._route_relation(uri)
+
+                if kind == 'object':
+                    resp = self._client.get(uri)
+                else:
+                    resp = self._client.get(uri, params={"all_ids":True})
                 if resp.status_code == 404:
+                    # not learned, as some routes only exist for some records, e.g. `previous` on a first child
                     raise AttributeError("'{}' has no attribute or route named '{}'".format(repr(self), key))
                 else:
-                    jmtype = dispatch_type(resp.json())
+                    jmtype, obj = classify(resp.json())
                     if (jmtype):
-                        return wrap_json_object(resp.json(), client=self._client)
-                    if any(r.match(uri) for r in solr_route_regexes):
-                        return SolrRelation(uri, client=self._client)
-                    return JSONModelRelation(uri, client=self._client)
-
-
-            if isinstance(self._json[key], list) and len(self._json[key]) > 0:
-                jmtype = dispatch_type(self._json[key][0])
-                if len(self._json[key]) == 0 or jmtype:
-                    return [wrap_json_object(obj, self._client) for obj in self._json[key]]
+                        learn_route(self._client, jsonmodel_type, key, 'object')
+                        return jmtype(obj, client=self._client)
+                    if resp.status_code == 200:
+                        learn_route(self._client, jsonmodel_type, key, 'relation')
+                    return self._route_relation(uri)
+
+            # each value is classified once, by wrapping it and checking whether that made a JSONModelObject
+            value = self._json[key]
+            if isinstance(value, list) and len(value) > 0:
+                first = wrap_json_object(value[0], self._client)
+                if isinstance(first, JSONModelObject):
+                    return [first] + [wrap_json_object(obj, self._client) for obj in value[1:]]
                 else:
                     # bare lists of Not Jsonmodel Stuff, ding dang note contents and suchlike
-                    return self._json[key]
-            elif dispatch_type(self._json[key]):
-                return wrap_json_object(self._json[key], self._client)
-            else:
-                return self._json[key]
+                    return value
+            wrapped = wrap_json_object(value, self._client)
+            return wrapped if isinstance(wrapped, JSONModelObject) else value
         else: return self.__getattribute__(key)
 
+    def _route_relation(self, uri):
+        if any(r.match(uri) for r in solr_route_regexes):
+            return SolrRelation(uri, client=self._client)
+        return JSONModelRelation(uri, client=self._client)
+
     def __str__(self):
         return json.dumps(self._json, indent=2)
 
     def __bytes__(self):
         return str(self).encode('utf8')
 
-    def json(self):
-        '''return safe-to-edit copy wrapped dict representing JSONModelObject contents.'''
+    def json(self, copy=True):
+        '''return safe-to-edit copy wrapped dict representing JSONModelObject contents.
+
+If `copy` is False, return a read-only view of the contents instead (see
+:func:`asnake.jsonlib.frozen`), which is much cheaper for big records you only need to read.'''
         self.reify()
-        return deepcopy(self._json)
+        if copy:
+            return deepcopy(self._json)
+        return jsonlib.frozen(self._json)
+
+    def update(self, mutator, retries=3):
+        '''Apply `mutator` to a copy of this object's JSON and POST the result back to ArchivesSpace.
+
+`mutator` is called with the JSON dict, and can either edit it in place or return a new dict.
+If the update is refused because the record has changed since it was fetched (a stale `lock_version`),
+only this record is fetched again and `mutator` re-applied to it, up to `retries` times.
+
+On success, the object is updated to the new JSON and lock_version, and the response is returned.
+Raises :class:`asnake.client.web_client.ASnakeConflictError` if conflicts persist, or
+:class:`asnake.client.web_client.ASnakeUpdateError` if the update is refused for any other reason.
+
+.. code-block:: python
+
+    ao.update(lambda ao_json: ao_json.update(title=ao_json['title'].strip()))
+'''
+        from asnake.client.web_client import ASnakeUpdateError, ASnakeConflictError
+        self.reify()
+        uri = self._json['uri']
+        for attempt in range(retries + 1):
+            new_json = deepcopy(self._json)
+            new_json = mutator(new_json) or new_json
+            resp = self._client.post(uri, json=new_json)
+            if resp.status_code == 200:
+                new_json['lock_version'] = resp.json().get('lock_version', new_json.get('lock_version'))
+                self._json = new_json
+                self._remember()
+                return resp
+            elif resp.status_code != 409:
+                raise ASnakeUpdateError("Update of {} failed with status: {}".format(uri, resp.status_code), resp)
+            get_logger(__name__).debug("update conflict, refetching", uri=uri, attempt=attempt)
+            self._json = self._client.get(uri).json()
+        raise ASnakeConflictError("Update of {} still conflicting after {} retries".format(uri, retries), resp)
 
 class ComponentObject(JSONModelObject):
     '''Specialized JSONModel subclass representing Archival Objects. Mostly exists to provide a way to get TreeNodes from AOs rather than having to start at the resource.'''
+    __slots__ = ()
+
     @property
     def tree(self):
-        '''Returns a TreeNode object for children of archival objects'''
+        '''Returns a TreeNode object for children of archival objects
+
+If the client keeps tree indexes (see :class:`TreeIndex`), the resource's tree is fetched and indexed
+once, so looking up the trees of many components in the same resource doesn't fetch or search the
+whole tree each time.  Otherwise, with `stream_json` set, the tree is streamed and only this
+component's subtree is built.'''
 
         try:
-            tree_object = find_subtree(self.resource.tree.json(), self.uri)
+            self.reify()
+            resource_uri = self._json['resource']['ref']
+            if getattr(self._client, 'tree_indexes', None) is None and self._client.config['stream_json']:
+                with self._client.get(resource_uri + '/tree', stream=True) as response:
+                    tree_object = streaming.find_subtree(streaming.iter_tree(response), self._json['uri'])
+            else:
+                tree_object = tree_index(self._client, resource_uri).node(self._json['uri'])
         except:
+            tree_object = None
+        if not tree_object:
             raise AttributeError("'{}' has no attribute '{}'".format(repr(self), "tree"))
         return wrap_json_object(tree_object, self._client)
 
+class LazySearchResult:
+    '''Mixin for JSONModel objects wrapping a search result, which only decode the record in its `json` field when needed.
+
+Fields also present in the search document (see :data:`search_fields`) are read from it until the
+record has been decoded; anything else decodes the record and carries on as usual.  Used by
+:func:`wrap_json_object` when the `lazy_search_results` config value is set.'''
+    __slots__ = () # _doc and _decoded are declared by the concrete classes, alongside JSONModelObject's slots
+
+    def __init__(self, doc, client = None):
+        self._doc = doc
+        self._decoded = None
+        self._client = client or type(self).default_client()
+        self.is_ref = False
+        self._remember()
+
+    @property
+    def _json(self):
+        if self._decoded is None:
+            self._decoded = jsonlib.loads(self._doc['json'])
+        return self._decoded
+
+    @_json.setter
+    def _json(self, value):
+        self._decoded = value
+
+    @property
+    def search_doc(self):
+        '''The search document this object was made from.'''
+        return self._doc
+
+    @property
+    def id(self):
+        '''See :attr:`JSONModelObject.id`.'''
+        val = self.uri.split('/')[-1]
+        if val.isdigit(): return(int(val))
+
+    def _remember(self):
+        identity_map = getattr(self._client, 'identity_map', None)
+        if identity_map is not None and 'uri' in self._doc:
+            identity_map[self._doc['uri']] = self
+
+    def __repr__(self):
+        if self._decoded is not None:
+            return super().__repr__()
+        return "#<{}:{}>".format(self._doc['primary_type'], self._doc.get('uri', self._doc['id']))
+
+    def __getattr__(self, key):
+        if self._decoded is None and key in search_fields and search_fields[key] in self._doc:
+            return self._doc[search_fields[key]]
+        return super().__getattr__(key)
+
+class LazyJSONModelObject(LazySearchResult, JSONModelObject):
+    '''JSONModelObject for a search result, which decodes its record only when needed.'''
+    __slots__ = ('_doc', '_decoded')
+
+class LazyComponentObject(LazySearchResult, ComponentObject):
+    '''ComponentObject for a search result, which decodes its record only when needed.'''
+    __slots__ = ('_doc', '_decoded')
+
+#: Attributes of lazy search results read from the search document, and the document fields they're read from
+search_fields = {
+    'uri': 'uri',
+    'title': 'title',
+    'jsonmodel_type': 'primary_type',
+}
+
+def wrap_search_doc(doc, client):
+    '''Wrap a search result in a :class:`LazySearchResult` of the right type, without decoding it.'''
+    if doc['primary_type'] in component_signifiers:
+        return LazyComponentObject(doc, client)
+    return LazyJSONModelObject(doc, client)
+
+# Only objects representing full records go in identity maps, tree nodes and node data are partial
+identity_types = frozenset({JSONModelObject, ComponentObject, LazyJSONModelObject, LazyComponentObject})
+
 class TreeNode(JSONModelObject):
     '''Specialized JSONModel subclass representing nodes in trees, as returned
 from `/repositories/:repo_id/resources/:id/tree <https://archivesspace.github.io/archivesspace/api/#get-a-resource-tree>`_.'''
+    __slots__ = ()
 
     def __repr__(self):
         result = "#<TreeNode:{}".format(self._json['node_type'])
@@ -242,6 +674,28 @@ from `/repositories/:repo_id/resources/:id/tree <https://archivesspace.github.io
         yield self.record
         yield from flatten(child.walk for child in self.children)
 
+    def parallel_walk(self, workers=None, ordered=True, window=None):
+        '''Walk of all objects in tree and children, with records fetched by a pool of `workers` threads
+(default: the `paged_workers` config value).
+
+If `ordered` is True, records are yielded in the same depth-first order as :attr:`walk`, with at
+most `window` records (default: twice the number of workers) fetched ahead of the one being waited
+on.  Otherwise, records are yielded as soon as they arrive.'''
+        def fetch(node):
+            return wrap_json_object(self._client.get(node['record_uri']).json(), self._client)
+
+        self.reify()
+        return bounded_map(fetch, self._nodes(), workers=workers or self._client.config['paged_workers'],
+                           window=window, ordered=ordered)
+
+    def _nodes(self):
+        '''Depth-first iterator over the JSON of this node and all nodes below it, without recursion.'''
+        stack = [self._json]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.get('children', [])))
+
     def node(self, node_uri):
         '''A sub-route existing on resources, which returns info on the node passed in.
 
@@ -256,6 +710,8 @@ Returned as an instance of :class:`TreeNodeData`.'''
 
 class TreeNodeData(JSONModelObject):
     '''Object representing data about a node in a tree.'''
+    __slots__ = ()
+
     def __repr__(self):
         return "#<TreeNodeData:{}:{}>".format(self._json['jsonmodel_type'], self._json['uri'])
 
@@ -311,10 +767,11 @@ Additionally, JSONModelRelations implement `__getattr__`, in order to handle nes
             del params['resolve']
         if myid:
             resp = self.client.get("/".join((self.uri.rstrip("/"), str(myid),)), params=params)
-            jmtype = dispatch_type(resp.json())
+            json_rep = resp.json()
+            jmtype, obj = classify(json_rep)
             if (jmtype):
-                return wrap_json_object(resp.json(), client=self.client)
-            return resp.json()
+                return jmtype(obj, client=self.client)
+            return json_rep
         else:
             return self.with_params(**params)
 
@@ -356,23 +813,44 @@ Usage:
         super().__init__(None, params, client)
 
     def __iter__(self):
-        repo_uris = [r['uri'] for r in self.client.get('repositories').json()]
-        for resource in chain(*[self.client.get_paged('{}/resources'.format(uri), params=self.params) for uri in repo_uris]):
+        for resource in chain(*[self.client.get_paged('{}/resources'.format(uri), params=self.params) for uri in self._repository_uris()]):
             yield wrap_json_object(resource, self.client)
 
+    def parallel_iter(self, workers=None, ordered=False):
+        '''Iterate over the resources of every repository at once, with a pool of `workers` threads
+(default: one per repository), so a sweep isn't held up by each repository in turn.
+
+If `ordered` is True, resources are yielded grouped by repository, as when iterating over the
+relation, with the other repositories read ahead; otherwise they're yielded as they arrive.
+See :func:`asnake.concurrency.merge_iterables`.'''
+        pages = [self.client.get_paged('{}/resources'.format(uri), params=self.params) for uri in self._repository_uris()]
+        for resource in merge_iterables(pages, workers=workers, ordered=ordered):
+            yield wrap_json_object(resource, self.client)
+
+    def _repository_uris(self):
+        # always fresh, unlike the ResourceIndex, so newly created repositories aren't skipped
+        return [r['uri'] for r in self.client.get('repositories').json()]
+
     def __call__(self, myid=None, **params):
+        '''Get the resource with id=myid, whatever repository it's in.
+
+Which repository that is comes from the client's :class:`ResourceIndex`, which is built on the first
+lookup, and rebuilt if a resource isn't in it, in case the resource is newer than the index.'''
         if 'resolve' in params:
             params['resolve[]'] = params['resolve']
             del params['resolve']
         if myid:
-            repo_uris = [r['uri'] for r in self.client.get('repositories').json()]
-            for uri in repo_uris:
-                if myid in self.client.get(uri + '/resources', params={'all_ids': True}).json():
-                    resp = self.client.get(uri + '/resources/{}'.format(myid), params=params)
-                    jmtype = dispatch_type(resp.json())
-                    if (jmtype):
-                        return wrap_json_object(resp.json(), client=self.client)
-                    return resp.json()
+            index = ResourceIndex.cached(self.client)
+            repo_uri = index.owner(myid) if index else None
+            if repo_uri is None:
+                repo_uri = ResourceIndex.build(self.client).keep(self.client).owner(myid)
+            if repo_uri is not None:
+                resp = self.client.get(repo_uri + '/resources/{}'.format(myid), params=params)
+                json_rep = resp.json()
+                jmtype, obj = classify(json_rep)
+                if (jmtype):
+                    return jmtype(obj, client=self.client)
+                return json_rep
             return {'error': 'Resource not found'}
         else:
             return self.with_params(**params)
@@ -380,7 +858,7 @@ Usage:
     def with_params(self, **params):
         merged = {}
         merged.update(self.params, **params)
-        return type(self)(self.params, self.client)
+        return type(self)(merged, self.client)
 
 class ASNakeBadAgentType(Exception): pass
 
@@ -406,6 +884,13 @@ Usage:
                                          {"all_ids": True},
                                          self.client)
 
+    def parallel_iter(self, workers=None, ordered=False):
+        '''Iterate over the agents of every type at once, with a pool of `workers` threads (default: one per type).
+
+If `ordered` is True, agents are yielded grouped by type, as when iterating over the relation;
+otherwise they're yielded as they arrive.  See :func:`asnake.concurrency.merge_iterables`.'''
+        return merge_iterables((self[agent_type] for agent_type in agent_types), workers=workers, ordered=ordered)
+
     def __getitem__(self, only):
         '''filter the AgentRelation to only the type or types passed in'''
         if isinstance(only, str):
@@ -432,11 +917,19 @@ Usage:
         return type(self).__bases__[0]("/".join((self.uri, key,)), params=self.params, client=self.client)
 
 def parse_jsondoc(doc, client):
-    return wrap_json_object(json.loads(doc['json']), client)
+    if doc.keys() >= searchdoc_signifiers:
+        return wrap_json_object(doc, client)
+    return wrap_json_object(jsonlib.loads(doc['json']), client)
 
 class SolrRelation(JSONModelRelation):
     '''Sometimes, the API returns solr responses, so we have to handle that. Facets are still tbd, but should be doable, but also I'm not sure if they're widely used and thus need to be handled?.'''
     def __iter__(self):
+        if self.client.config['stream_json']:
+            with self.client.get(self.uri, params=self.params, stream=True) as response:
+                for doc in streaming.iter_items(response, 'response.docs'):
+                    yield parse_jsondoc(doc, self.client)
+            return
+
         res = self.client.get(self.uri, params=self.params).json()
         for doc in res['response']['docs']:
             yield parse_jsondoc(doc, self.client)
@@ -0,0 +1,369 @@
+'''asyncio counterparts to the classes in :mod:`asnake.jsonmodel`, for use with :class:`asnake.client.aio.AsyncASnakeClient`.
+
+Attribute access on these objects never makes an HTTP request. Values present in the wrapped
+JSON are returned as normal, and any other attribute is treated as a subsidiary API route
+and returned as an :class:`AsyncJSONModelRelation`.  Whatever needs data from ArchivesSpace is awaited:
+
+.. code-block:: python
+
+    repo = await aspace.repositories(2)          # fetch a single object
+    async for ao in aspace.repositories(2).archival_objects:
+        ...                                      # iterate over a collection route
+    tree = await resource.tree                   # fetch a route returning a single object
+    agent = await ao.linked_agents[0].reify()    # resolve a ref
+'''
+from copy import deepcopy
+from itertools import chain
+
+from asnake.jsonmodel import JSONModel, JSONModelObject, ComponentObject, TreeNode, TreeNodeData, \
+    classify, TreeIndex, ResourceIndex, solr_route_regexes, agent_types, agent_types_set, \
+    ASNakeBadAgentType
+import asnake.jsonlib as jsonlib
+from asnake.logging import get_logger
+from asnake.client.web_client import ASnakeUpdateError, ASnakeConflictError
+from asnake.concurrency import async_bounded_map, async_merge_iterables
+
+class AsyncJSONModel(JSONModel):
+    '''Metaclass for async JSONModel classes, whose default client is an :class:`asnake.client.aio.AsyncASnakeClient`.'''
+
+    def __init__(cls, name, parents, dct):
+        super().__init__(name, parents, dct)
+        cls.__default_client = None
+
+    def default_client(cls):
+        '''return existing AsyncASnakeClient or create, store, and return a new AsyncASnakeClient'''
+        if not cls.__default_client:
+            from asnake.client import AsyncASnakeClient
+            cls.__default_client = AsyncASnakeClient()
+        return cls.__default_client
+
+def wrap_json_object(obj, client=None):
+    '''Classify object, and either wrap it in the correct async JSONModel type or return it as is.
+
+Async equivalent of :func:`asnake.jsonmodel.wrap_json_object`.'''
+    jmtype, obj = classify(obj)
+    if jmtype and not isinstance(obj, JSONModelObject):
+        obj = async_types[jmtype](obj, client)
+    return obj
+
+class AsyncJSONModelObject(JSONModelObject, metaclass=AsyncJSONModel):
+    '''Async counterpart to :class:`asnake.jsonmodel.JSONModelObject`.
+
+Objects which are refs must be reified with `await obj.reify()` (or just `await obj`) before
+fields not present in the ref can be read.'''
+    __slots__ = ()
+
+    async def reify(self, **params):
+        '''Convert object from a ref into a realized object.'''
+        if self.is_ref:
+            if '_resolved' in self._json:
+                self._json = self._json['_resolved']
+            else:
+                self._json = (await self._client.get(self._json['ref'], params=params)).json()
+            self.is_ref = False
+        return self
+
+    def __await__(self):
+        return self.reify().__await__()
+
+    def __dir__(self):
+        return sorted(set(chain(self._json.keys(), (x for x in dir(type(self)) if not x.startswith("_")))))
+
+    def __getattr__(self, key):
+        '''Access to properties on the JSONModel object and objects from descendant API routes.
+
+Values present in the wrapped JSON are returned directly.  Any other name is assumed to be a
+route below the object's URI, and is returned as an :class:`AsyncJSONModelRelation`, which can
+either be iterated with `async for` or awaited, depending on what the route returns.'''
+        if key.startswith('_') or key == 'is_ref':
+            return self.__getattribute__(key)
+
+        if key not in self._json:
+            if key == 'uri' and self.is_ref: return self._json['ref']
+            uri = self._json.get('uri', self._json.get('ref', None))
+            if not uri:
+                raise AttributeError("'{}' has no attribute '{}'".format(repr(self), key))
+            full_uri = "/".join((uri.rstrip("/"), key,))
+            if any(r.match(full_uri) for r in solr_route_regexes):
+                return AsyncSolrRelation(full_uri, client=self._client)
+            return AsyncJSONModelRelation(full_uri, client=self._client)
+
+        value = self._json[key]
+        if isinstance(value, list) and len(value) > 0:
+            first = wrap_json_object(value[0], self._client)
+            if isinstance(first, JSONModelObject):
+                return [first] + [wrap_json_object(obj, self._client) for obj in value[1:]]
+            return value
+        wrapped = wrap_json_object(value, self._client)
+        return wrapped if isinstance(wrapped, JSONModelObject) else value
+
+    def json(self, copy=True):
+        '''return safe-to-edit copy wrapped dict representing JSONModelObject contents.
+
+Unlike :meth:`asnake.jsonmodel.JSONModelObject.json`, this does not reify refs.'''
+        if copy:
+            return deepcopy(self._json)
+        return jsonlib.frozen(self._json)
+
+    async def update(self, mutator, retries=3):
+        '''Async counterpart to :meth:`asnake.jsonmodel.JSONModelObject.update`.
+
+.. code-block:: python
+
+    await ao.update(lambda ao_json: ao_json.update(title=ao_json['title'].strip()))
+'''
+        await self.reify()
+        uri = self._json['uri']
+        for attempt in range(retries + 1):
+            new_json = deepcopy(self._json)
+            new_json = mutator(new_json) or new_json
+            resp = await self._client.post(uri, json=new_json)
+            if resp.status_code == 200:
+                new_json['lock_version'] = resp.json().get('lock_version', new_json.get('lock_version'))
+                self._json = new_json
+                return resp
+            elif resp.status_code != 409:
+                raise ASnakeUpdateError("Update of {} failed with status: {}".format(uri, resp.status_code), resp)
+            get_logger(__name__).debug("update conflict, refetching", uri=uri, attempt=attempt)
+            self._json = (await self._client.get(uri)).json()
+        raise ASnakeConflictError("Update of {} still conflicting after {} retries".format(uri, retries), resp)
+
+class AsyncComponentObject(AsyncJSONModelObject):
+    '''Async counterpart to :class:`asnake.jsonmodel.ComponentObject`.'''
+    __slots__ = ()
+
+    @property
+    async def tree(self):
+        '''Returns an AsyncTreeNode object for children of archival objects, indexing the resource's tree
+as :attr:`asnake.jsonmodel.ComponentObject.tree` does.'''
+        await self.reify()
+        resource_uri = self._json['resource']['ref']
+        index = TreeIndex.cached(self._client, resource_uri)
+        if index is None:
+            resp = await self._client.get("/".join((resource_uri, 'tree',)))
+            index = TreeIndex(resource_uri, resp.json()).keep(self._client)
+        tree_object = index.node(self._json['uri'])
+        if not tree_object:
+            raise AttributeError("'{}' has no attribute '{}'".format(repr(self), "tree"))
+        return wrap_json_object(tree_object, self._client)
+
+class AsyncTreeNode(AsyncJSONModelObject):
+    '''Async counterpart to :class:`asnake.jsonmodel.TreeNode`.'''
+    __slots__ = ()
+    __repr__ = TreeNode.__repr__
+
+    @property
+    async def record(self):
+        '''returns the full AsyncJSONModelObject for a node'''
+        await self.reify()
+        resp = await self._client.get(self._json['record_uri'])
+        return wrap_json_object(resp.json(), self._client)
+
+    @property
+    def walk(self):
+        '''Serial walk of all objects in tree and children (depth-first traversal), as an async iterator'''
+        return self._walk()
+
+    async def _walk(self):
+        await self.reify()
+        yield await self.record
+        for child in self.children:
+            async for record in child.walk:
+                yield record
+
+    async def node(self, node_uri):
+        '''A sub-route existing on resources, which returns info on the node passed in.
+
+Returned as an instance of :class:`AsyncTreeNodeData`.'''
+        await self.reify()
+        if self._json['node_type'] != 'resource':
+            raise NotImplementedError('This route only exists on resources')
+        else:
+            resp = await self._client.get("/".join((self._json['record_uri'], 'tree/node',)), params={"node_uri": node_uri})
+            return wrap_json_object(resp.json(), self._client)
+
+class AsyncTreeNodeData(AsyncJSONModelObject):
+    '''Async counterpart to :class:`asnake.jsonmodel.TreeNodeData`.'''
+    __slots__ = ()
+    __repr__ = TreeNodeData.__repr__
+    __getattr__ = TreeNodeData.__getattr__
+
+    @property
+    async def record(self):
+        resp = await self._client.get(self._json['uri'])
+        return wrap_json_object(resp.json(), self._client)
+
+async_types = {
+    JSONModelObject: AsyncJSONModelObject,
+    ComponentObject: AsyncComponentObject,
+    TreeNode: AsyncTreeNode,
+    TreeNodeData: AsyncTreeNodeData,
+}
+
+class AsyncJSONModelRelation(metaclass=AsyncJSONModel):
+    '''Async counterpart to :class:`asnake.jsonmodel.JSONModelRelation`.
+
+    - iterate over the relation with `async for` to get all objects
+    - call the relation with an id to get an object with a known id, which can be awaited to fetch it
+    - await the relation itself to fetch a route that returns a single object, e.g. `await resource.tree`
+'''
+
+    def __init__(self, uri, params = {}, client = None):
+        self.uri = uri
+        self.client = client or type(self).default_client()
+        self.params = params
+
+    def __repr__(self):
+        return "#<{}:{}:{}>".format(type(self).__name__, self.uri, self.params)
+
+    async def __aiter__(self):
+        async for jm in self.client.get_paged(self.uri, params=self.params):
+            yield wrap_json_object(jm, self.client)
+
+    def __await__(self):
+        return self._fetch().__await__()
+
+    async def _fetch(self):
+        resp = await self.client.get(self.uri, params=self.params)
+        if resp.status_code == 404:
+            raise AttributeError("No route at '{}'".format(self.uri))
+        return wrap_json_object(resp.json(), client=self.client)
+
+    def __call__(self, myid=None, **params):
+        '''Get an AsyncJSONModelObject from the relation by id.
+
+Without params, this returns an unresolved ref, which can be awaited to fetch the object, or used to
+reach routes below it without fetching it.  With params, a coroutine fetching the object is returned.'''
+        # Special handling for resolve because it takes a string or an array and requires [] for array
+        if 'resolve' in params:
+            params['resolve[]'] = params['resolve']
+            del params['resolve']
+        if myid:
+            ref = AsyncJSONModelObject({"ref": "/".join((self.uri.rstrip("/"), str(myid),))}, self.client)
+            return ref.reify(**params) if params else ref
+        else:
+            return self.with_params(**params)
+
+    def with_params(self, **params):
+        '''Return relation with same uri and client, but add kwargs to params.'''
+        merged = {}
+
+        merged.update(self.params, **params)
+        return type(self)(self.uri, merged, self.client)
+
+    def __getattr__(self, key):
+        full_uri = "/".join((self.uri, key,))
+        if any(r.match(full_uri) for r in solr_route_regexes):
+            return AsyncSolrRelation(full_uri, params=self.params, client=self.client)
+        return type(self)(full_uri, params=self.params, client=self.client)
+
+class AsyncResourceRelation(AsyncJSONModelRelation):
+    '''Async counterpart to :class:`asnake.jsonmodel.ResourceRelation`.'''
+    def __init__(self, params={}, client = None):
+        super().__init__(None, params, client)
+
+    async def __aiter__(self):
+        for uri in await self._repository_uris():
+            async for resource in self.client.get_paged('{}/resources'.format(uri), params=self.params):
+                yield wrap_json_object(resource, self.client)
+
+    async def parallel_iter(self, ordered=False):
+        '''Async counterpart to :meth:`asnake.jsonmodel.ResourceRelation.parallel_iter`, with a task per repository.'''
+        pages = [self.client.get_paged('{}/resources'.format(uri), params=self.params) for uri in await self._repository_uris()]
+        async for resource in async_merge_iterables(pages, ordered=ordered):
+            yield wrap_json_object(resource, self.client)
+
+    async def _repository_uris(self):
+        return [r['uri'] for r in (await self.client.get('repositories')).json()]
+
+    def __call__(self, myid=None, **params):
+        '''Returns a coroutine fetching the resource with id=myid, regardless of what repo it's in.'''
+        if 'resolve' in params:
+            params['resolve[]'] = params['resolve']
+            del params['resolve']
+        if myid:
+            return self._find(myid, params)
+        else:
+            return self.with_params(**params)
+
+    async def _find(self, myid, params):
+        index = ResourceIndex.cached(self.client)
+        repo_uri = index.owner(myid) if index else None
+        if repo_uri is None:
+            repo_uri = (await self._build_index()).keep(self.client).owner(myid)
+        if repo_uri is not None:
+            resp = await self.client.get(repo_uri + '/resources/{}'.format(myid), params=params)
+            return wrap_json_object(resp.json(), client=self.client)
+        return {'error': 'Resource not found'}
+
+    async def _build_index(self):
+        '''Async counterpart to :meth:`asnake.jsonmodel.ResourceIndex.build`.'''
+        repo_uris = [r['uri'] for r in (await self.client.get('repositories')).json()]
+        async def ids(uri):
+            return (await self.client.get(uri + '/resources', params={'all_ids': True})).json()
+        resource_ids = [ids async for ids in async_bounded_map(ids, repo_uris, workers=self.client.config['paged_workers'])]
+        return ResourceIndex(repo_uris, resource_ids)
+
+    def with_params(self, **params):
+        merged = {}
+        merged.update(self.params, **params)
+        return type(self)(merged, self.client)
+
+class AsyncAgentRelation(AsyncJSONModelRelation):
+    '''Async counterpart to :class:`asnake.jsonmodel.AgentRelation`.'''
+
+    async def __aiter__(self):
+        for agent_type in agent_types:
+            async for agent in self[agent_type]:
+                yield agent
+
+    def parallel_iter(self, ordered=False):
+        '''Async counterpart to :meth:`asnake.jsonmodel.AgentRelation.parallel_iter`, with a task per agent type.'''
+        return async_merge_iterables([self[agent_type] for agent_type in agent_types], ordered=ordered)
+
+    def __getitem__(self, only):
+        '''filter the AsyncAgentRelation to only the type passed in'''
+        if not only in agent_types_set:
+            raise ASNakeBadAgentType("'{}' is not a type of agent ASnake knows about".format(only))
+        return AsyncJSONModelRelation("/".join((self.uri.rstrip("/"), only,)),
+                                      {"all_ids": True},
+                                      self.client)
+
+    def __repr__(self):
+        return "#<AsyncAgentRelation:/agents>"
+
+    def __call__(self, *args, **kwargs):
+        raise NotImplementedError("__call__ is not implemented on AsyncAgentRelation")
+
+    # override parent __getattr__ because needs to return base class impl for descendant urls
+    def __getattr__(self, key):
+        return AsyncJSONModelRelation("/".join((self.uri, key,)), params=self.params, client=self.client)
+
+class AsyncSolrRelation(AsyncJSONModelRelation):
+    '''Async counterpart to :class:`asnake.jsonmodel.SolrRelation`.'''
+    async def __aiter__(self):
+        res = (await self.client.get(self.uri, params=self.params)).json()
+        for doc in res['response']['docs']:
+            yield wrap_json_object(jsonlib.loads(doc['json']), self.client)
+
+    def __call__(self, *args, **kwargs):
+        raise NotImplementedError("__call__ is not implemented for SolrRelations")
+
+class AsyncUserRelation(AsyncJSONModelRelation):
+    '''Async counterpart to :class:`asnake.jsonmodel.UserRelation`.'''
+    async def __aiter__(self):
+        async for user in self.client.get_paged('/users', params=self.params):
+            yield wrap_json_object((await self.client.get(user['uri'])).json(), self.client)
+
+    @property
+    async def current_user(self):
+        '''`/users/current-user` route.'''
+        return wrap_json_object((await self.client.get('users/current-user', params=self.params)).json(), self.client)
+
+    # override parent __getattr__ because needs to return base class impl for descendant urls
+    def __getattr__(self, key):
+        p = {k:v for k, v in self.params.items()}
+        if len(p) == 0:
+            p['all_ids'] = True
+
+        return AsyncJSONModelRelation("/".join((self.uri, key,)), params=p, client=self.client)
@@ -5,10 +5,13 @@
 from datetime import date
 import re
 from rapidfuzz import fuzz
-from asnake.jsonmodel import JSONModelObject
+from asnake.jsonmodel import JSONModelObject, ComponentObject
+from asnake.client.web_client import ASnakeArgumentError, listlike_seq
+from asnake.jsonlib import FrozenMapping, FrozenSequence
 from string import Formatter
 from collections.abc import Mapping
 from itertools import chain
+from concurrent.futures import ThreadPoolExecutor
 
 
 def resolve_to_uri(thingit):
@@ -22,7 +25,7 @@ this method will return a string containing the URI for that resource.
     uri = None
     # if object has .json(), replace with value of .json()
     if callable(getattr(thingit, 'json', None)):
-        thingit = thingit.json()
+        thingit = _json_of(thingit, copy=False)
     if isinstance(thingit, str):
         uri = thingit
     elif isinstance(thingit, Mapping):
@@ -32,18 +35,28 @@ this method will return a string containing the URI for that resource.
     return uri
 
 
-def resolve_to_json(thingit, client):
+def _json_of(thingit, copy=True):
+    """JSON of an object responding to .json(), without a copy if it's a JSONModelObject and copy is False."""
+    if isinstance(thingit, JSONModelObject):
+        return thingit.json(copy=copy)
+    return thingit.json()
+
+
+def resolve_to_json(thingit, client, copy=True):
     """Given any of:
 - the URI for an ArchivesSpace object
 - an object responding to .json() returning such a dict
 
 this method will return a JSON representation of that object.
+
+If `copy` is False, JSONModelObjects are resolved to a read-only view of their JSON
+(see :func:`asnake.jsonlib.frozen`) rather than a copy, for callers that only read it.
 """
     json = None
-    if isinstance(thingit, dict):
+    if isinstance(thingit, Mapping):
         json = thingit
     elif callable(getattr(thingit, 'json', None)):
-        json = thingit.json()
+        json = _json_of(thingit, copy=copy)
     else:
         uri = resolve_to_uri(thingit)
         json = client.get(thingit).json()
@@ -52,6 +65,13 @@ this method will return a JSON representation of that object.
     return json
 
 
+def _plain(value):
+    '''Return an editable copy of value if it's a read-only view (see :func:`asnake.jsonlib.frozen`), otherwise value itself.'''
+    if isinstance(value, (FrozenMapping, FrozenSequence)):
+        return value.copy()
+    return value
+
+
 def get_note_text(note, client):
     """Parses note content from different note types.
 
@@ -68,7 +88,7 @@ def get_note_text(note, client):
         :returns: a list containing subnote content.
         :rtype: list
         """
-        subnote = resolve_to_json(subnote, client)
+        subnote = resolve_to_json(subnote, client, copy=False)
         if subnote["jsonmodel_type"] in [
                 "note_orderedlist", "note_index"]:
             content = subnote["items"]
@@ -76,14 +96,13 @@ def get_note_text(note, client):
             content = []
             for k in subnote["items"]:
                 for i in k:
-                    content += k.get(i) if isinstance(k.get(i),
-                                                      list) else [k.get(i)]
+                    content += k.get(i) if listlike_seq(k.get(i)) else [k.get(i)]
         else:
-            content = subnote["content"] if isinstance(
-                subnote["content"], list) else [subnote["content"]]
+            content = subnote["content"] if listlike_seq(
+                subnote["content"]) else [subnote["content"]]
         return content
 
-    note = resolve_to_json(note, client)
+    note = resolve_to_json(note, client, copy=False)
     if note["jsonmodel_type"] in ["note_singlepart", "note_langmaterial"]:
         content = note["content"]
     elif note["jsonmodel_type"] == "note_bibliography":
@@ -100,7 +119,8 @@ def get_note_text(note, client):
         subnote_content_list = [parse_subnote(sn, client) for sn in note["subnotes"]]
         content = [
             c for subnote_content in subnote_content_list for c in subnote_content]
-    return content
+    # content, and items in it, may be read-only views of the note's own JSON
+    return [_plain(c) for c in content]
 
 
 def text_in_note(note, query_string, client, confidence=97):
@@ -114,7 +134,7 @@ def text_in_note(note, query_string, client, confidence=97):
             found.
     :rtype: bool
     """
-    note = resolve_to_json(note, client)
+    note = resolve_to_json(note, client, copy=False)
     note_content = get_note_text(note, client)
     ratio = fuzz.partial_ratio(
         " ".join([n.lower() for n in note_content]),
@@ -131,7 +151,7 @@ def format_from_obj(obj, format_string, client):
     :returns: a string in the chosen format.
     :rtype: str
     """
-    obj = resolve_to_json(obj, client)
+    obj = resolve_to_json(obj, client, copy=False)
     if not format_string:
         raise Exception("No format string provided.")
     else:
@@ -156,7 +176,7 @@ def format_resource_id(resource, client, separator=":"):
     :returns: a concatenated four-part ID for the resource record.
     :rtype: str
     """
-    resource = resolve_to_json(resource, client)
+    resource = resolve_to_json(resource, client, copy=False)
     resource_id = []
     for x in range(4):
         try:
@@ -218,7 +238,7 @@ def get_date_display(date, client):
     :returns: date expression for the date object.
     :rtype: str
     """
-    date = resolve_to_json(date, client)
+    date = resolve_to_json(date, client, copy=False)
     try:
         expression = date["expression"]
     except KeyError:
@@ -237,7 +257,7 @@ def indicates_restriction(rights_statement, restriction_acts, client):
     :returns: True if rights statement indicates a restriction, False if not.
     :rtype: bool
     """
-    rights_statement = resolve_to_json(rights_statement, client)
+    rights_statement = resolve_to_json(rights_statement, client, copy=False)
     if is_expired(rights_statement.get("end_date")):
         return False
     for act in rights_statement.get("acts"):
@@ -274,7 +294,7 @@ def is_restricted(archival_object, query_string, restriction_acts, client):
     :returns: True if archival object is restricted, False if not.
     :rtype: bool
     """
-    archival_object = resolve_to_json(archival_object, client)
+    archival_object = resolve_to_json(archival_object, client, copy=False)
     for note in archival_object["notes"]:
         if note["type"] == "accessrestrict":
             if text_in_note(note, query_string.lower(), client):
@@ -314,7 +334,7 @@ with the archival object.
         for container_loc in instance['sub_container']['top_container']['_resolved']['container_locations']:
             yield container_loc['_resolved']
 
-def walk_tree(thingit, client):
+def walk_tree(thingit, client, workers=None, window=None, fetch_records=True):
     """Given any of:
 - the URI for a resource
 - the URI for an archival object
@@ -322,7 +342,22 @@ def walk_tree(thingit, client):
 
 and an :class:`asnake.client.ASnakeClient`, this method will return a generator
 which yields the JSON representation of each successive element in the resource's tree,
-in order."""
+in order.
+
+If `workers` (default: the client's `paged_workers` config value) is greater than 1, records
+and waypoint pages for up to `window` (default: twice the number of workers) upcoming siblings
+at each level of the tree are fetched concurrently, ahead of being yielded.
+
+`fetch_records` controls what is yielded for each element:
+
+- True (the default): the full record, fetched individually
+- False: the waypoint data as is (uri, title, level, dates, child counts, etc.) with no request per record
+- "lazy": a :class:`asnake.jsonmodel.JSONModelObject` wrapping the waypoint data, which fetches the
+  full record only if a field not present in the waypoint data is accessed
+- "batched": the full record, fetched with the records of its siblings via
+  :meth:`asnake.client.web_client.ASnakeClient.get_many`"""
+    if fetch_records not in {True, False, 'lazy', 'batched'}:
+        raise ASnakeArgumentError("fetch_records must be one of True, False, 'lazy' or 'batched'")
     uri = resolve_to_uri(thingit)
 
     params = {'offset': 0}
@@ -340,7 +375,8 @@ in order."""
         starting_waypoint = client.get("/".join([resource_uri, "tree/node"]), params=params).json()
     else:
         starting_waypoint = client.get("/".join([resource_uri, "tree/root"]), params=params).json()
-    yield from _handle_waypoint(waypoints_uri, starting_waypoint, client)
+    workers = workers or client.config['paged_workers']
+    yield from _walk_waypoints(waypoints_uri, starting_waypoint, client, workers, window or workers * 2, fetch_records)
 
 def _page_waypoint_children(waypoints_uri, waypoint, client):
     params = {}
@@ -352,10 +388,72 @@ def _page_waypoint_children(waypoints_uri, waypoint, client):
         for wp in client.get(waypoints_uri, params=params).json():
             yield wp
 
-def _handle_waypoint(waypoints_uri, waypoint, client):
-    # yield the record itself
-    yield client.get(waypoint['uri']).json()
+class _Deferred:
+    """Stand-in for a Future which does its work when first asked for its result, for walking serially.
+    Like a Future, the work is only done once, however many times the result is asked for."""
+    def __init__(self, fn, *args):
+        self.fn, self.args = fn, args
+        self.done = False
+
+    def result(self):
+        if not self.done:
+            self.value = self.fn(*self.args)
+            self.done = True
+            self.fn = self.args = None
+        return self.value
+
+    def cancel(self): pass
+
+def _lazy_record(waypoint, client):
+    """Wrap waypoint data as a ref to its record, so that the record is only fetched if a field not
+    present in the waypoint is accessed."""
+    jmtype = ComponentObject if 'archival_objects' in waypoint['uri'] else JSONModelObject
+    return jmtype(dict(waypoint, ref=waypoint['uri']), client)
+
+def _walk_waypoints(waypoints_uri, start, client, workers, window, fetch_records):
+    # Iterative pre-order walk; each entry in levels is a list of sibling waypoints, the index of the
+    # next one to yield, (record, children) futures for the siblings being prefetched, and when
+    # fetching records in batches, a future for the records of all the siblings
+    pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    submit = pool.submit if pool else _Deferred
+
+    def prefetch(wp, batch):
+        if fetch_records == 'batched':
+            record = _Deferred(lambda: batch.result().get(wp['uri']) or client.get(wp['uri']).json())
+        elif fetch_records == 'lazy':
+            record = _Deferred(_lazy_record, wp, client)
+        elif fetch_records:
+            record = submit(lambda: client.get(wp['uri']).json())
+        else:
+            record = _Deferred(lambda: wp)
+        return (record, submit(lambda: list(_page_waypoint_children(waypoints_uri, wp, client))),)
+
+    def level(siblings):
+        batch = None
+        if fetch_records == 'batched':
+            batch = submit(lambda: client.get_many([wp['uri'] for wp in siblings]))
+        return (siblings, 0, {}, batch)
 
-    # resource, omit parent_node_param
-    for wp in _page_waypoint_children(waypoints_uri, waypoint, client):
-            yield from _handle_waypoint(waypoints_uri, wp, client)
+    levels = [level([start])]
+    try:
+        while levels:
+            siblings, position, prefetched, batch = levels[-1]
+            if position >= len(siblings):
+                levels.pop()
+                continue
+            for i in range(position, min(position + window, len(siblings))):
+                if i not in prefetched:
+                    prefetched[i] = prefetch(siblings[i], batch)
+            record, children = prefetched.pop(position)
+            levels[-1] = (siblings, position + 1, prefetched, batch)
+
+            yield record.result()
+            children = children.result()
+            if children:
+                levels.append(level(children))
+    finally:
+        for _, _, prefetched, batch in levels:
+            for futures in prefetched.values():
+                for future in futures: future.cancel()
+            if batch: batch.cancel()
+        if pool: pool.shutdown(wait=False)
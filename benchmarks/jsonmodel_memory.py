@@ -0,0 +1,54 @@
+'''Memory cost of JSONModelObject wrappers, compared with the previous `__dict__`-based classes.
+
+Measures, with :mod:`tracemalloc`, the memory allocated by wrapping many refs, not counting the
+ref dicts themselves, which are the same either way.
+
+Run from the repository root with `python benchmarks/jsonmodel_memory.py`.  No ArchivesSpace
+instance is needed.'''
+import tracemalloc
+import gc
+import sys, os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from asnake.jsonmodel import JSONModelObject, ComponentObject
+
+class LegacyJSONModelObject:
+    '''Instance layout of JSONModelObject before it had `__slots__`.'''
+    def __init__(self, json_rep, client = None):
+        self._json = json_rep
+        self._client = client
+        self.is_ref = 'ref' in json_rep
+
+class LegacyComponentObject(LegacyJSONModelObject): pass
+
+class Client:
+    identity_map = None
+    config = {'lazy_search_results': False}
+
+def wrapper_bytes(cls, refs, client):
+    gc.collect()
+    tracemalloc.start()
+    wrappers = [cls(ref, client) for ref in refs]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, wrappers
+
+def main(n=1000000):
+    client = Client()
+    refs = [{"ref": "/repositories/2/archival_objects/{}".format(i)} for i in range(n)]
+    # the list holding the wrappers is the same size either way
+    list_size = sys.getsizeof([None] * n)
+
+    print("{} refs, bytes per wrapper (not counting the ref dicts)".format(n))
+    for legacy, current in ((LegacyJSONModelObject, JSONModelObject), (LegacyComponentObject, ComponentObject)):
+        sizes = []
+        for cls in (legacy, current):
+            size, wrappers = wrapper_bytes(cls, refs, client)
+            sizes.append((size - list_size) / n)
+            del wrappers
+        print("{:<16} legacy {:6.1f}   current {:6.1f}   ({:.0%} of legacy)".format(
+            current.__name__, sizes[0], sizes[1], sizes[1] / sizes[0]))
+
+if __name__ == '__main__':
+    main()
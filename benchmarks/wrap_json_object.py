@@ -0,0 +1,100 @@
+'''Per-object cost of classifying and wrapping JSON with asnake.jsonmodel.
+
+Compares the current single-pass :func:`asnake.jsonmodel.classify` pipeline with the previous
+one, where search results were checked for (and decoded from) their `json` field once in
+`wrap_json_object` and again in `dispatch_type`, and attribute access classified values twice.
+The `title read` case uses the `lazy_search_results` config value, which skips decoding altogether.
+
+Run from the repository root with `python benchmarks/wrap_json_object.py`.  No ArchivesSpace
+instance is needed.'''
+from timeit import repeat
+import json
+import sys, os
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asnake.jsonlib as jsonlib
+from asnake.jsonmodel import wrap_json_object, JSONModelObject, ComponentObject, TreeNode, TreeNodeData, \
+    component_signifiers, jmtype_signifiers, searchdoc_signifiers, node_signifiers, node_data_signifiers
+
+def legacy_dispatch_type(obj):
+    value = False
+    if isinstance(obj, dict):
+        if searchdoc_signifiers.issubset(set(obj)):
+            obj = jsonlib.loads(obj['json'])
+
+        ref_type = [x for x in obj['ref'].split("/") if not x.isdigit()][-1] if 'ref' in obj else None
+        if obj.get("jsonmodel_type", ref_type) in component_signifiers:
+            if node_data_signifiers.issubset(set(obj)):
+                return TreeNodeData
+            else:
+                value = ComponentObject
+        elif node_signifiers.intersection(obj.keys()) or ref_type == "tree":
+            value = TreeNode
+        elif jmtype_signifiers.intersection(obj.keys()):
+            value = JSONModelObject
+    return value
+
+def legacy_wrap_json_object(obj, client=None):
+    if isinstance(obj, dict):
+        if searchdoc_signifiers.issubset(set(obj)):
+            obj = jsonlib.loads(obj['json'])
+    jmtype = legacy_dispatch_type(obj)
+    if jmtype:
+        obj = jmtype(obj, client)
+    return obj
+
+def legacy_getattr(value, client):
+    '''What JSONModelObject.__getattr__ did with a value from the JSON.'''
+    if isinstance(value, list) and len(value) > 0:
+        if legacy_dispatch_type(value[0]):
+            return [legacy_wrap_json_object(obj, client) for obj in value]
+        return value
+    elif legacy_dispatch_type(value):
+        return legacy_wrap_json_object(value, client)
+    return value
+
+def record(i):
+    return {"jsonmodel_type": "archival_object", "uri": "/repositories/2/archival_objects/{}".format(i),
+            "title": "Folder {}".format(i), "level": "file", "lock_version": 0,
+            "subjects": [{"ref": "/subjects/{}".format(n)} for n in range(5)],
+            "resource": {"ref": "/repositories/2/resources/1"}}
+
+def searchdoc(i):
+    return {"id": "/repositories/2/archival_objects/{}".format(i), "primary_type": "archival_object",
+            "types": ["archival_object"], "title": "Folder {}".format(i), "json": json.dumps(record(i))}
+
+class Client:
+    identity_map = None
+    def __init__(self, **config):
+        self.config = dict({"lazy_search_results": False}, **config)
+
+def main(n=20000):
+    client = Client()
+    lazy_client = Client(lazy_search_results=True)
+    docs = [searchdoc(i) for i in range(n)]
+    refs = [{"ref": "/repositories/2/archival_objects/{}".format(i)} for i in range(n)]
+    parent = JSONModelObject(record(0), client)
+
+    cases = [
+        ("search result", docs, lambda doc: legacy_wrap_json_object(doc, client), lambda doc: wrap_json_object(doc, client)),
+        ("search result, title read", docs, lambda doc: legacy_wrap_json_object(doc, client).title,
+         lambda doc: wrap_json_object(doc, lazy_client).title),
+        ("ref", refs, lambda ref: legacy_wrap_json_object(ref, client), lambda ref: wrap_json_object(ref, client)),
+        ("attribute (list of 5 refs)", [parent] * n, lambda obj: legacy_getattr(obj._json['subjects'], client),
+         lambda obj: obj.subjects),
+    ]
+
+    print("backend: {}, {} objects per run, best of 5".format(jsonlib.backend.name, n))
+    for name, objs, legacy, current in cases:
+        # alternate runs, so neither side consistently gets the warmer heap
+        runs = {legacy: [], current: []}
+        for _ in range(5):
+            for fn in runs:
+                runs[fn].extend(repeat(lambda: [fn(obj) for obj in objs], number=1, repeat=1))
+        timings = [min(runs[fn]) / n * 1e6 for fn in (legacy, current)]
+        print("{:<28} legacy {:7.2f} us/object   current {:7.2f} us/object   ({:.1f}x)".format(
+            name, timings[0], timings[1], timings[0] / timings[1]))
+
+if __name__ == '__main__':
+    main()
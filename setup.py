@@ -26,4 +26,9 @@ setup(
 	    "structlog",
 	    "more_itertools",
     ],
+    extras_require={
+        "async": ["httpx"],
+        "streaming": ["ijson"],
+        "fast": ["orjson"],
+    },
 )
@@ -1,3 +1,68 @@
 from vcr import VCR
+from requests.adapters import BaseAdapter
+from requests.models import Response
+from urllib.parse import urlsplit, parse_qs
+from threading import Lock
+import json
 
 vcr = VCR(func_path_generator = lambda test: "tests/fixtures/cassettes/{}--{}.yaml".format(test.__module__, test.__name__))
+
+class CannedAdapter(BaseAdapter):
+    '''Transport adapter answering requests from a function, for tests that don't need a live ASpace.
+
+The function is called with (method, path, query) where query is the parsed query string,
+and should return either a JSON-serializable value, or a (status_code, value) tuple.
+If `with_headers` is True, the request headers are passed as a fourth argument.'''
+
+    def __init__(self, respond, with_headers=False):
+        super().__init__()
+        self.respond = respond
+        self.with_headers = with_headers
+        self.calls = []
+        self.lock = Lock()
+
+    def send(self, request, **kwargs):
+        url = urlsplit(request.url)
+        query = parse_qs(url.query)
+        with self.lock:
+            self.calls.append((request.method, url.path, query))
+        if self.with_headers:
+            answer = self.respond(request.method, url.path, query, request.headers)
+        else:
+            answer = self.respond(request.method, url.path, query)
+        status, body = answer if isinstance(answer, tuple) else (200, answer)
+
+        resp = Response()
+        resp.status_code = status
+        resp._content = json.dumps(body).encode('utf8')
+        resp.headers['Content-Type'] = 'application/json'
+        resp.url = request.url
+        resp.request = request
+        return resp
+
+    def close(self): pass
+
+def canned_client(respond, with_headers=False, **config):
+    '''ASnakeClient whose requests are all answered by a :class:`CannedAdapter`.'''
+    from asnake.client import ASnakeClient
+    client = ASnakeClient(baseurl="http://aspace.test", **config)
+    adapter = CannedAdapter(respond, with_headers)
+    client.session.mount("http://aspace.test", adapter)
+    return client, adapter
+
+def canned_async_client(respond, **config):
+    '''AsyncASnakeClient whose requests are all answered by `respond`, as for :class:`CannedAdapter`.'''
+    import httpx
+    from asnake.client import AsyncASnakeClient
+    calls = []
+
+    def handler(request):
+        query = parse_qs(request.url.query.decode('utf8'))
+        calls.append((request.method, request.url.path, query))
+        answer = respond(request.method, request.url.path, query)
+        status, body = answer if isinstance(answer, tuple) else (200, answer)
+        return httpx.Response(status, json=body)
+
+    client = AsyncASnakeClient(baseurl="http://aspace.test", **config)
+    client.session = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client, calls
@@ -1,6 +1,7 @@
-from .common import vcr
+from .common import vcr, canned_client, canned_async_client
 from asnake.aspace import ASpace
 from asnake.jsonmodel import JSONModelObject, TreeNode, ComponentObject, JSONModelRelation, searchdoc_signifiers
+import asyncio
 import os
 
 conf_file = None
@@ -90,3 +91,444 @@ def teardown():
         os.environ['ASNAKE_CONFIG_FILE'] = conf_file
     else:
         os.environ.pop('ASNAKE_CONFIG_FILE')
+
+def async_repository(method, path, query):
+    if path == '/repositories/2':
+        return {"jsonmodel_type": "repository", "uri": path, "name": "Pancakes",
+                "agent_representation": {"ref": "/agents/corporate_entities/1"}}
+    if path == '/agents/corporate_entities/1':
+        return {"jsonmodel_type": "agent_corporate_entity", "uri": path, "title": "Pancake House"}
+    if path == '/repositories/2/archival_objects':
+        return {"first_page": 1, "last_page": 1, "this_page": 1, "total": 2,
+                "results": [{"jsonmodel_type": "archival_object", "uri": "/repositories/2/archival_objects/{}".format(i)} for i in (1, 2)]}
+    return (404, {"error": "not found"})
+
+def test_async_jsonmodel():
+    from asnake.aspace.aio import AsyncASpace
+    from asnake.jsonmodel.aio import AsyncJSONModelObject, AsyncComponentObject, AsyncJSONModelRelation
+
+    async def run():
+        aspace = AsyncASpace(baseurl="http://aspace.test")
+        aspace.client, calls = canned_async_client(async_repository)
+
+        aos = [ao async for ao in aspace.repositories(2).archival_objects]
+        assert [ao.uri for ao in aos] == ["/repositories/2/archival_objects/1", "/repositories/2/archival_objects/2"]
+        assert all(isinstance(ao, AsyncComponentObject) for ao in aos)
+        assert len(calls) == 1
+
+        repo = await aspace.repositories(2)
+        assert isinstance(repo, AsyncJSONModelObject) and repo.name == "Pancakes"
+        assert isinstance(repo.resources, AsyncJSONModelRelation)
+        agent = repo.agent_representation
+        assert agent.is_ref
+        await agent.reify()
+        assert agent.title == "Pancake House"
+        assert len(calls) == 3
+
+    asyncio.run(run())
+
+def test_identity_map():
+    from asnake.jsonmodel import wrap_json_object
+    client, adapter = canned_client(async_repository, identity_map_size=2)
+
+    refs = [wrap_json_object({"ref": "/agents/corporate_entities/1", "role": "creator"}, client) for _ in range(3)]
+    assert all(ref.reify().title == "Pancake House" for ref in refs)
+    assert len(adapter.calls) == 1
+    assert refs[1]._json is refs[0]._json
+
+    # writes through the client drop the stale object
+    client.post("/agents/corporate_entities/1", json=refs[0].json())
+    wrap_json_object({"ref": "/agents/corporate_entities/1"}, client).reify()
+    assert [m for m, p, q in adapter.calls] == ['GET', 'POST', 'GET']
+
+    # and the map is bounded
+    for i in range(3):
+        wrap_json_object({"jsonmodel_type": "subject", "uri": "/subjects/{}".format(i)}, client)
+    assert sorted(client.identity_map.keys()) == ["/subjects/1", "/subjects/2"]
+
+def linked_records(method, path, query):
+    if 'id_set[]' in query:
+        if path == '/agents/people':
+            return [{"jsonmodel_type": "agent_person", "uri": "/agents/people/{}".format(i)} for i in query['id_set[]']]
+        return (400, {"error": "id_set not supported"})
+    return {"jsonmodel_type": "thing", "uri": path}
+
+def test_reify_many():
+    from asnake.jsonmodel import wrap_json_object, reify_many
+    client, adapter = canned_client(linked_records)
+    refs = [wrap_json_object({"ref": uri}, client) for uri in
+            ["/agents/people/{}".format(i) for i in range(1, 6)] +
+            ["/agents/people/1", "/subjects/1", "/subjects/2", "/repositories/2/resources/1/tree"]]
+    refs.append(wrap_json_object({"ref": "/agents/families/1", "_resolved": {"jsonmodel_type": "agent_family", "uri": "/agents/families/1"}}, client))
+
+    assert reify_many(refs, batch_size=3, workers=2) == refs
+    assert not any(ref.is_ref for ref in refs)
+    assert [ref.uri for ref in refs[:5]] == ["/agents/people/{}".format(i) for i in range(1, 6)]
+    assert refs[-1].jsonmodel_type == "agent_family"
+    # two people batches, one failed subjects batch, then each subject and the tree individually
+    assert len(adapter.calls) == 6
+
+def test_parallel_walk():
+    from asnake.jsonmodel import wrap_json_object, TreeNode
+    def node(uri, *children):
+        return {"node_type": "archival_object", "record_uri": uri, "has_children": bool(children), "children": list(children)}
+    tree = node("/repositories/2/resources/1",
+                node("/repositories/2/archival_objects/1",
+                     node("/repositories/2/archival_objects/2"),
+                     node("/repositories/2/archival_objects/3", node("/repositories/2/archival_objects/4"))),
+                node("/repositories/2/archival_objects/5"))
+    tree['node_type'] = 'resource'
+    client, adapter = canned_client(lambda method, path, query: {"jsonmodel_type": "archival_object", "uri": path})
+    tree_node = wrap_json_object(tree, client)
+    assert isinstance(tree_node, TreeNode)
+
+    serial = [r.uri for r in tree_node.walk]
+    assert serial == [r.uri for r in tree_node.parallel_walk(workers=3, window=2)]
+    assert sorted(serial) == sorted(r.uri for r in tree_node.parallel_walk(workers=3, ordered=False))
+
+    # starting from a ref, as resource.tree returns
+    def respond(method, path, query):
+        if path == "/repositories/2/resources/1/tree":
+            return tree
+        return {"jsonmodel_type": "archival_object", "uri": path}
+    client, adapter = canned_client(respond)
+    ref = wrap_json_object({"ref": "/repositories/2/resources/1/tree"}, client)
+    assert isinstance(ref, TreeNode) and ref.is_ref
+    assert serial == [r.uri for r in ref.parallel_walk(workers=2)]
+
+    async def run():
+        from asnake.jsonmodel.aio import wrap_json_object as async_wrap, AsyncTreeNode
+        client, calls = canned_async_client(respond)
+        ref = async_wrap({"ref": "/repositories/2/resources/1/tree"}, client)
+        assert isinstance(ref, AsyncTreeNode)
+        assert serial == [r.uri async for r in ref.walk]
+    asyncio.run(run())
+
+def test_update_retries_conflicts():
+    from asnake.jsonmodel import wrap_json_object, update_many
+    from asnake.client.web_client import ASnakeConflictError
+    import pytest
+    lock_versions = {"/subjects/1": 0, "/subjects/2": 0, "/subjects/3": 0}
+    conflicts = {"/subjects/1": 1, "/subjects/2": 0, "/subjects/3": 10}
+    def respond(method, path, query):
+        if method == 'GET':
+            return {"jsonmodel_type": "subject", "uri": path, "title": "Subject ", "lock_version": lock_versions[path]}
+        if conflicts[path]:
+            # someone else saved the record first
+            conflicts[path] -= 1
+            lock_versions[path] += 1
+            return 409, {"error": {"lock_version": ["stale"]}}
+        lock_versions[path] += 1
+        return {"status": "Updated", "uri": path, "lock_version": lock_versions[path]}
+
+    client, adapter = canned_client(respond)
+    subject = wrap_json_object({"ref": "/subjects/1"}, client)
+    subject.update(lambda json: json.update(title=json['title'].strip()))
+    assert subject.title == "Subject"
+    assert subject.lock_version == 2
+    # reify, conflicting post, refetch, post
+    assert [call[0] for call in adapter.calls] == ['GET', 'POST', 'GET', 'POST']
+
+    adapter.calls.clear()
+    results = list(update_many([wrap_json_object({"ref": uri}, client) for uri in ("/subjects/2", "/subjects/3")],
+                               lambda json: dict(json, title="Renamed"), workers=2, retries=2, ordered=True))
+    assert results[0].ok and results[0].json['title'] == "Renamed"
+    assert isinstance(results[1].error, ASnakeConflictError) and results[1].conflict
+    with pytest.raises(ASnakeConflictError):
+        wrap_json_object({"ref": "/subjects/3"}, client).update(lambda json: None, retries=0)
+
+    from asnake.jsonmodel.aio import wrap_json_object as async_wrap_json_object
+    async def run():
+        conflicts["/subjects/1"] = 1
+        client, calls = canned_async_client(respond)
+        subject = async_wrap_json_object({"ref": "/subjects/1"}, client)
+        await subject.update(lambda json: json.update(title="Async"))
+        assert subject.title == "Async" and subject.lock_version == lock_versions["/subjects/1"]
+        assert [call[0] for call in calls] == ['GET', 'POST', 'GET', 'POST']
+        with pytest.raises(ASnakeConflictError):
+            await async_wrap_json_object({"ref": "/subjects/3"}, client).update(lambda json: None, retries=0)
+    asyncio.run(run())
+
+def test_component_tree_streaming():
+    from asnake.jsonmodel import wrap_json_object
+    tree = {"record_uri": "/repositories/2/resources/1", "node_type": "resource", "has_children": True, "children": [
+        {"record_uri": "/repositories/2/archival_objects/1", "node_type": "archival_object", "has_children": True, "children": [
+            {"record_uri": "/repositories/2/archival_objects/2", "node_type": "archival_object", "has_children": False, "children": []}]},
+        {"record_uri": "/repositories/2/archival_objects/3", "node_type": "archival_object", "has_children": False, "children": []}]}
+    def respond(method, path, query):
+        if path.endswith('/tree'):
+            return tree
+        return {"jsonmodel_type": "archival_object", "uri": path, "resource": {"ref": "/repositories/2/resources/1"}}
+
+    for stream_json in (False, True):
+        client, adapter = canned_client(respond, stream_json=stream_json)
+        ao = wrap_json_object({"ref": "/repositories/2/archival_objects/1"}, client)
+        assert ao.tree.json() == tree['children'][0]
+    # streaming goes straight to the tree without loading the resource
+    assert [call[1] for call in adapter.calls] == ["/repositories/2/archival_objects/1", "/repositories/2/resources/1/tree"]
+
+def test_tree_index():
+    from asnake.jsonmodel import wrap_json_object, tree_index
+    tree = {"record_uri": "/repositories/2/resources/1", "node_type": "resource", "has_children": True, "children": [
+        {"record_uri": "/repositories/2/archival_objects/1", "node_type": "archival_object", "has_children": True, "children": [
+            {"record_uri": "/repositories/2/archival_objects/2", "node_type": "archival_object", "has_children": False, "children": []}]},
+        {"record_uri": "/repositories/2/archival_objects/3", "node_type": "archival_object", "has_children": False, "children": []}]}
+    def respond(method, path, query):
+        if path.endswith('/tree'):
+            return tree
+        return {"jsonmodel_type": "archival_object", "uri": path, "resource": {"ref": "/repositories/2/resources/1"}}
+
+    client, adapter = canned_client(respond, tree_index_size=1)
+    for n in (1, 2, 3):
+        ao = wrap_json_object({"ref": "/repositories/2/archival_objects/{}".format(n)}, client)
+        assert ao.tree.record_uri == ao.uri
+    assert sum(call[1].endswith('/tree') for call in adapter.calls) == 1
+
+    index = tree_index(client, "/repositories/2/resources/1")
+    assert index.parent("/repositories/2/archival_objects/2") == tree["children"][0]
+    assert index.parent("/repositories/2/resources/1") is None
+
+    # writes to a record in the tree, or adding one to the resource, drop the index
+    client.post("/repositories/2/archival_objects/2", json={})
+    assert len(client.tree_indexes) == 0
+    tree_index(client, "/repositories/2/resources/1")
+    client.post("/repositories/2/archival_objects", json={"resource": {"ref": "/repositories/2/resources/1"}})
+    assert len(client.tree_indexes) == 0
+
+    # at most tree_index_size trees are kept
+    tree_index(client, "/repositories/2/resources/1")
+    tree_index(client, "/repositories/2/resources/2")
+    assert list(client.tree_indexes) == ["/repositories/2/resources/2"]
+
+    # expired trees are dropped, and by default none are kept
+    for config in (dict(tree_index_size=10, tree_index_ttl=0), {}):
+        client, adapter = canned_client(respond, **config)
+        ao = wrap_json_object({"ref": "/repositories/2/archival_objects/3"}, client)
+        ao.tree, ao.tree
+        assert sum(call[1].endswith('/tree') for call in adapter.calls) == 2
+    assert client.tree_indexes is None
+
+def repositories_with_resources(method, path, query):
+    holdings = {"/repositories/2": [1, 2], "/repositories/3": [3]}
+    if path == '/repositories':
+        return [{"jsonmodel_type": "repository", "uri": uri} for uri in holdings]
+    if path.endswith('/resources') and 'all_ids' in query:
+        return holdings[path[:-len('/resources')]]
+    return {"jsonmodel_type": "resource", "uri": path}
+
+def test_resource_index():
+    from asnake.jsonmodel import ResourceRelation
+    from asnake.aspace.aio import AsyncASpace
+    client, adapter = canned_client(repositories_with_resources, paged_workers=2)
+    resources = ResourceRelation({}, client)
+
+    assert resources(3).uri == "/repositories/3/resources/3"
+    assert len(adapter.calls) == 4
+    assert resources(1).uri == "/repositories/2/resources/1"
+    assert len(adapter.calls) == 5
+    # unknown ids rebuild the index in case the resource is new
+    assert resources(4) == {'error': 'Resource not found'}
+    assert len(adapter.calls) == 8
+    # iterating still lists the repositories afresh, rather than trusting the index
+    adapter.calls.clear()
+    assert resources._repository_uris() == ["/repositories/2", "/repositories/3"]
+    assert adapter.calls == [("GET", "/repositories", {})]
+    # creating a resource drops the index
+    client.post("/repositories/2/resources", json={})
+    assert client.resource_index is None
+
+    assert resources.with_params(resolve=['subjects']).params == {'resolve': ['subjects']}
+
+    async def run():
+        aspace = AsyncASpace(baseurl="http://aspace.test")
+        aspace.client, calls = canned_async_client(repositories_with_resources, paged_workers=2)
+        assert (await aspace.resources(3)).uri == "/repositories/3/resources/3"
+        assert (await aspace.resources(2)).uri == "/repositories/2/resources/2"
+        assert len(calls) == 5
+    asyncio.run(run())
+
+def test_parallel_iter():
+    from asnake.jsonmodel import ResourceRelation, AgentRelation, agent_types
+    from asnake.jsonmodel.aio import AsyncResourceRelation, AsyncAgentRelation
+    def respond(method, path, query):
+        if path == '/repositories':
+            return [{"jsonmodel_type": "repository", "uri": "/repositories/{}".format(n)} for n in (2, 3, 4)]
+        if 'all_ids' in query:
+            return [1, 2]
+        if path.startswith('/agents/'):
+            return {"jsonmodel_type": "agent", "uri": path}
+        return {"first_page": 1, "last_page": 1, "this_page": 1, "total": 2,
+                "results": [{"jsonmodel_type": "resource", "uri": "{}/{}".format(path, n)} for n in (1, 2)]}
+
+    client, adapter = canned_client(respond)
+    serial = [r.uri for r in ResourceRelation({}, client)]
+    assert [r.uri for r in ResourceRelation({}, client).parallel_iter(ordered=True)] == serial
+    assert sorted(r.uri for r in ResourceRelation({}, client).parallel_iter(workers=2)) == sorted(serial)
+
+    agents = AgentRelation("/agents", {}, client)
+    assert [a.uri for a in agents.parallel_iter(ordered=True)] == [a.uri for a in agents]
+    assert len(list(agents.parallel_iter())) == 2 * len(agent_types)
+
+    async def run():
+        client, calls = canned_async_client(respond)
+        resources = AsyncResourceRelation({}, client)
+        assert [r.uri async for r in resources.parallel_iter(ordered=True)] == serial
+        assert sorted([r.uri async for r in resources.parallel_iter()]) == sorted(serial)
+        agents = AsyncAgentRelation("/agents", {}, client)
+        assert len([a async for a in agents.parallel_iter()]) == 2 * len(agent_types)
+    asyncio.run(run())
+
+def test_route_registry():
+    from asnake.jsonmodel import wrap_json_object, JSONModelRelation, TreeNode
+    import pytest
+    def respond(method, path, query):
+        if path.endswith('/tree'):
+            return {"record_uri": "/repositories/2/resources/1", "node_type": "resource", "children": []}
+        if path.endswith('/linked_instances'):
+            return [{"ref": "/repositories/2/top_containers/1"}]
+        if path == "/repositories/2/archival_objects/2/previous":
+            return {"jsonmodel_type": "archival_object", "uri": "/repositories/2/archival_objects/1"}
+        return (404, {"error": "not found"})
+
+    client, adapter = canned_client(respond)
+    repo = wrap_json_object({"jsonmodel_type": "repository", "uri": "/repositories/2"}, client)
+    assert isinstance(repo.resources, JSONModelRelation)
+    assert adapter.calls == []
+    resource = wrap_json_object({"jsonmodel_type": "resource", "uri": "/repositories/2/resources/1"}, client)
+    assert isinstance(resource.tree, TreeNode)
+    assert adapter.calls == [("GET", "/repositories/2/resources/1/tree", {})]
+
+    aos = [wrap_json_object({"jsonmodel_type": "archival_object", "uri": "/repositories/2/archival_objects/{}".format(n)}, client)
+           for n in (1, 2)]
+    for ao in aos:
+        assert isinstance(ao.linked_instances, JSONModelRelation)
+    # only the first archival object's collection route needed probing
+    assert len(adapter.calls) == 2
+
+    # a route missing for one record may exist for another
+    with pytest.raises(AttributeError):
+        aos[0].previous
+    assert aos[1].previous.uri == "/repositories/2/archival_objects/1"
+
+    # absent optional fields that are never routes don't cost a request
+    adapter.calls.clear()
+    for record, field in ((aos[0], 'component_id'), (aos[0], 'parent'), (resource, 'ead_id'),
+                          (resource, 'finding_aid_title')):
+        with pytest.raises(AttributeError):
+            getattr(record, field)
+    assert adapter.calls == []
+    assert isinstance(resource.tree, TreeNode)
+
+def test_classify_decodes_once(monkeypatch):
+    from asnake.jsonmodel import wrap_json_object, classify, dispatch_type, TreeNode
+    import asnake.jsonlib as jsonlib
+    import json
+    decoded = []
+    loads = jsonlib.loads
+    monkeypatch.setattr(jsonlib, 'loads', lambda s: decoded.append(s) or loads(s))
+    client, adapter = canned_client(lambda method, path, query: {})
+
+    record = {"jsonmodel_type": "archival_object", "uri": "/repositories/2/archival_objects/1"}
+    doc = {"id": record['uri'], "primary_type": "archival_object", "types": ["archival_object"], "json": json.dumps(record)}
+    ao = wrap_json_object(doc, client)
+    assert isinstance(ao, ComponentObject) and ao.json() == record
+    assert len(decoded) == 1
+
+    assert wrap_json_object(ao, client) is ao
+    assert classify(ao) == (ComponentObject, ao)
+    assert dispatch_type({"ref": "/repositories/2/resources/1/tree"}) is TreeNode
+    assert dispatch_type({"ref": "/repositories/2/archival_objects/1"}) is ComponentObject
+    assert dispatch_type(["not", "a", "record"]) is False
+
+    # attribute access classifies and decodes each value once, lists included
+    import asnake.jsonmodel as jm
+    import asnake.jsonmodel.aio as aio
+    classified = []
+    for module in (jm, aio):
+        monkeypatch.setattr(module, 'classify', lambda obj, classify=module.classify: classified.append(obj) or classify(obj))
+    for wrap in (wrap_json_object, aio.wrap_json_object):
+        parent = wrap({"jsonmodel_type": "resource", "uri": "/repositories/2/resources/1",
+                       "subjects": [{"ref": "/subjects/1"}, {"ref": "/subjects/2"}], "notes": ["a", "b"],
+                       "repository": {"ref": "/repositories/2"}, "results": [doc, doc]}, client)
+        decoded.clear()
+        classified.clear()
+        assert [s.uri for s in parent.subjects] == ["/subjects/1", "/subjects/2"]
+        assert parent.notes == ["a", "b"]
+        assert parent.repository.uri == "/repositories/2"
+        assert len(classified) == 4
+        assert [r.uri for r in parent.results] == [record['uri']] * 2
+        assert len(decoded) == 2
+
+def test_lazy_search_results(monkeypatch):
+    from asnake.jsonmodel import wrap_json_object, SolrRelation, LazySearchResult
+    import asnake.jsonlib as jsonlib
+    import json
+    decoded = []
+    loads = jsonlib.loads
+    monkeypatch.setattr(jsonlib, 'loads', lambda s: decoded.append(s) or loads(s))
+
+    def doc(i):
+        record = {"jsonmodel_type": "archival_object", "uri": "/repositories/2/archival_objects/{}".format(i),
+                  "title": "Folder {}".format(i), "level": "file"}
+        return {"id": record['uri'], "uri": record['uri'], "title": record['title'], "primary_type": "archival_object",
+                "types": ["archival_object"], "json": json.dumps(record)}
+    client, adapter = canned_client(lambda method, path, query: {"response": {"docs": [doc(1), doc(2)]}},
+                                    lazy_search_results=True, identity_map_size=10)
+
+    results = list(SolrRelation("/repositories/2/top_containers/search", client=client))
+    assert all(isinstance(ao, ComponentObject) and isinstance(ao, LazySearchResult) for ao in results)
+    assert [(ao.uri, ao.title, ao.jsonmodel_type, ao.id) for ao in results] == \
+        [("/repositories/2/archival_objects/1", "Folder 1", "archival_object", 1),
+         ("/repositories/2/archival_objects/2", "Folder 2", "archival_object", 2)]
+    assert repr(results[0]) == "#<archival_object:/repositories/2/archival_objects/1>"
+    assert decoded == []
+
+    assert results[0].level == "file"
+    assert results[0].json()['level'] == "file"
+    assert len(decoded) == 1
+    # identity map holds the lazy object, and refs to it reify from there
+    assert wrap_json_object({"ref": "/repositories/2/archival_objects/2"}, client).level == "file"
+    assert len(decoded) == 2 and len(adapter.calls) == 1
+
+def test_jsonmodel_slots():
+    from asnake.jsonmodel import wrap_json_object, LazyComponentObject
+    from asnake.jsonmodel.aio import AsyncComponentObject
+    import weakref
+    import pytest
+    client, adapter = canned_client(lambda method, path, query: {})
+    ao = wrap_json_object({"jsonmodel_type": "archival_object", "uri": "/repositories/2/archival_objects/1", "title": "Folder"}, client)
+    lazy = LazyComponentObject({"uri": "/x", "json": "{}", "primary_type": "archival_object"}, client)
+    for obj in (ao, lazy, AsyncComponentObject(ao._json, client)):
+        assert not hasattr(obj, '__dict__')
+    assert weakref.ref(ao)() is ao
+    with pytest.raises(AttributeError):
+        ao.anything_else = True
+    assert {'title', 'uri', 'json', 'reify', 'tree', 'is_ref'} <= set(dir(ao))
+    assert not any(name.startswith('_') for name in dir(ao))
+
+def test_json_without_copy():
+    from asnake.jsonmodel import wrap_json_object
+    from asnake.jsonlib import FrozenMapping
+    from asnake import utils
+    import pytest
+    posted = []
+    client, adapter = canned_client(lambda method, path, query: posted.append(path) or {"status": "Updated"})
+    record = {"jsonmodel_type": "resource", "uri": "/repositories/2/resources/1", "id_0": "MS", "id_1": "1",
+              "dates": [{"begin": "1900", "end": "1950"}], "notes": [], "rights_statements": []}
+    resource = wrap_json_object(record, client)
+
+    view = resource.json(copy=False)
+    assert isinstance(view, FrozenMapping) and view == record and view['dates'] == record['dates']
+    assert view['dates'][0]._data is record['dates'][0] # shared, not copied
+    with pytest.raises(TypeError):
+        view['title'] = "Changed"
+    with pytest.raises(AttributeError):
+        view['dates'].append({})
+    editable = view.copy()
+    editable['title'] = "Changed"
+    assert 'title' not in record
+
+    assert utils.format_resource_id(resource, client) == "MS:1"
+    assert utils.get_date_display(resource.json(copy=False)['dates'][0], client) == "1900-1950"
+    assert not utils.is_restricted(resource, "restricted", ["disseminate"], client)
+    assert client.post(resource.uri, json=view).json() == {"status": "Updated"}
@@ -5,9 +5,10 @@ from pytest import raises
 import vcr
 from asnake.aspace import ASpace
 from asnake.jsonmodel import wrap_json_object
+from asnake.jsonlib import frozen
 from asnake import utils
 
-from .common import vcr
+from .common import vcr, canned_client
 
 
 def load_fixture(filename, client=None):
@@ -59,6 +60,16 @@ def test_get_note_text():
         result = utils.get_note_text(note, client)
         assert isinstance(result, list)
         assert set(result) == set(expected)
+        # read-only views, as helpers get from JSONModelObjects, read the same
+        assert utils.get_note_text(frozen(note), client) == result
+
+
+def test_get_note_text_returns_plain_values():
+    client, adapter = canned_client(lambda method, path, query: {})
+    note = {"jsonmodel_type": "note_multipart", "subnotes": [
+        {"jsonmodel_type": "note_index", "items": [{"value": "Mets", "type": "name"}]}]}
+    result = utils.get_note_text(wrap_json_object(note, client), client)
+    assert result == [{"value": "Mets", "type": "name"}] and type(result[0]) is dict
 
 
 @vcr.use_cassette
@@ -215,3 +226,80 @@ def test_format_from_obj():
                 formatted = utils.format_from_obj(
                     date, "{start} - {end} ({expression})", client)
             assert "was not found in this object" in str(excpt.value)
+
+
+def waypoint_tree(children_of):
+    """Canned responder for the tree/root, tree/waypoint and record routes of resource 1,
+    with children_of mapping each uri to a list of its children's uris."""
+    resource = "/repositories/2/resources/1"
+    def waypoint(uri):
+        kids = children_of.get(uri, [])
+        return {"uri": uri, "child_count": len(kids), "waypoints": (len(kids) + 1) // 2, "waypoint_size": 2}
+
+    def respond(method, path, query):
+        if path == resource + "/tree/root":
+            return waypoint(resource)
+        if path == resource + "/tree/waypoint":
+            offset = int(query['offset'][0])
+            parent = query.get('parent_node', [resource])[0]
+            return [waypoint(uri) for uri in children_of.get(parent, [])[offset * 2:offset * 2 + 2]]
+        return {"jsonmodel_type": "resource" if path == resource else "archival_object", "uri": path}
+    return respond
+
+
+def test_walk_tree():
+    ao = "/repositories/2/archival_objects/{}".format
+    children_of = {
+        "/repositories/2/resources/1": [ao(1), ao(2), ao(3)],
+        ao(1): [ao(4), ao(5), ao(6)],
+        ao(5): [ao(7)],
+        ao(3): [ao(8)]}
+    client, adapter = canned_client(waypoint_tree(children_of))
+    expected = ["/repositories/2/resources/1", ao(1), ao(4), ao(5), ao(7), ao(6), ao(2), ao(3), ao(8)]
+    assert [r['uri'] for r in utils.walk_tree("/repositories/2/resources/1", client)] == expected
+    assert [r['uri'] for r in utils.walk_tree("/repositories/2/resources/1", client, workers=4, window=2)] == expected
+
+
+def test_walk_tree_deep():
+    ao = "/repositories/2/archival_objects/{}".format
+    children_of = {ao(i): [ao(i + 1)] for i in range(1, 2000)}
+    children_of["/repositories/2/resources/1"] = [ao(1)]
+    client, adapter = canned_client(waypoint_tree(children_of))
+    assert len(list(utils.walk_tree("/repositories/2/resources/1", client, workers=2))) == 2001
+
+
+def test_walk_tree_fetch_records():
+    ao = "/repositories/2/archival_objects/{}".format
+    children_of = {"/repositories/2/resources/1": [ao(1), ao(2), ao(3)], ao(2): [ao(4)]}
+    expected = ["/repositories/2/resources/1", ao(1), ao(2), ao(4), ao(3)]
+    respond = waypoint_tree(children_of)
+    def respond_with_id_set(method, path, query):
+        if 'id_set[]' in query:
+            return [{"jsonmodel_type": "archival_object", "uri": "{}/{}".format(path, i)} for i in query['id_set[]']]
+        return respond(method, path, query)
+
+    client, adapter = canned_client(respond_with_id_set)
+    waypoints = list(utils.walk_tree("/repositories/2/resources/1", client, fetch_records=False))
+    assert [wp['uri'] for wp in waypoints] == expected
+    assert 'child_count' in waypoints[2]
+    # root, then waypoint pages of the resource (2) and ao 2 (1)
+    assert len(adapter.calls) == 4
+
+    adapter.calls.clear()
+    lazy = list(utils.walk_tree("/repositories/2/resources/1", client, fetch_records="lazy"))
+    assert [r.uri for r in lazy] == expected
+    assert len(adapter.calls) == 4
+    assert lazy[1].jsonmodel_type == "archival_object"
+    assert len(adapter.calls) == 5
+
+    # one id_set request per level of siblings, whether walking serially or not
+    for workers in (1, 2):
+        adapter.calls.clear()
+        batched = list(utils.walk_tree("/repositories/2/resources/1", client, workers=workers, fetch_records="batched"))
+        assert [r['uri'] for r in batched] == expected
+        assert all('jsonmodel_type' in r for r in batched)
+        assert len([q for m, p, q in adapter.calls if 'id_set[]' in q]) == 3
+        assert len(adapter.calls) == 7
+
+    with raises(Exception):
+        next(utils.walk_tree("/repositories/2/resources/1", client, fetch_records="sometimes"))
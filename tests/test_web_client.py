@@ -1,5 +1,6 @@
-from .common import vcr
+from .common import vcr, canned_client, canned_async_client
 from asnake.client import ASnakeClient
+import asyncio
 import os
 
 conf_file = None
@@ -28,3 +29,341 @@ def teardown():
         os.environ['ASNAKE_CONFIG_FILE'] = conf_file
     else:
         os.environ.pop('ASNAKE_CONFIG_FILE')
+
+def paged_archival_objects(method, path, query):
+    page, page_size = int(query['page'][0]), int(query['page_size'][0])
+    ids = range((page - 1) * page_size + 1, min(page * page_size, 45) + 1)
+    return {"first_page": 1, "last_page": 5, "this_page": page, "total": 45,
+            "results": [{"jsonmodel_type": "archival_object", "uri": "/repositories/2/archival_objects/{}".format(i)} for i in ids]}
+
+def test_get_paged_concurrent_pages_keep_order():
+    client, adapter = canned_client(paged_archival_objects)
+    serial = [o['uri'] for o in client.get_paged('repositories/2/archival_objects', page_size=10)]
+    concurrent = [o['uri'] for o in client.get_paged('repositories/2/archival_objects', page_size=10, workers=4)]
+    assert len(serial) == 45
+    assert serial == concurrent
+    assert sorted(int(q['page'][0]) for m, p, q in adapter.calls[5:]) == [1, 2, 3, 4, 5]
+
+def agents_by_id(method, path, query):
+    if path == '/agents/people' and 'all_ids' in query:
+        return list(range(1, 12))
+    if path == '/agents/people':
+        # id_set queries come back in whatever order the db likes
+        return [{"uri": "/agents/people/{}".format(i)} for i in sorted(map(int, query['id_set[]']), reverse=True)]
+    return {"uri": path}
+
+def test_get_paged_all_ids_expansion():
+    client, adapter = canned_client(agents_by_id)
+    expected = ["/agents/people/{}".format(i) for i in range(1, 12)]
+    assert [a['uri'] for a in client.get_paged('agents/people', params={"all_ids": True}, workers=3)] == expected
+    assert len(adapter.calls) == 12
+
+    adapter.calls.clear()
+    batched = client.get_by_ids('agents/people', range(1, 12), batch_size=5)
+    assert [a['uri'] for a in batched] == expected
+    assert len(adapter.calls) == 3
+
+def test_get_paged_streaming():
+    client, adapter = canned_client(paged_archival_objects)
+    streamed, _ = canned_client(paged_archival_objects, stream_json=True)
+    expected = [o['uri'] for o in client.get_paged('repositories/2/archival_objects', page_size=10)]
+    assert [o['uri'] for o in streamed.get_paged('repositories/2/archival_objects', page_size=10)] == expected
+    assert [o['uri'] for o in streamed.get_paged('repositories/2/archival_objects', page_size=10, workers=3)] == expected
+
+    streamed, adapter = canned_client(agents_by_id, stream_json=True, id_batch_size=5)
+    assert [a['uri'] for a in streamed.get_paged('agents/people', params={"all_ids": True})] == \
+        ["/agents/people/{}".format(i) for i in range(1, 12)]
+    assert len(adapter.calls) == 4
+
+def test_iter_tree_holds_nodes_until_record_uri():
+    from asnake.client import streaming
+    from requests.models import Response
+    import json
+    response = Response()
+    # ArchivesSpace doesn't promise key order, record_uri can come after children
+    response._content = json.dumps({"title": "resource", "children": [
+        {"children": [{"record_uri": "/ao/2", "children": []}], "record_uri": "/ao/1"},
+        {"record_uri": "/ao/3", "children": [], "title": "last"}], "record_uri": "/resource"}).encode('utf8')
+    nodes = list(streaming.iter_tree(response))
+    assert [(depth, node['record_uri']) for depth, node in nodes] == \
+        [(0, "/resource"), (1, "/ao/1"), (2, "/ao/2"), (1, "/ao/3")]
+    assert nodes[-1][1] == {"record_uri": "/ao/3", "title": "last"}
+
+    subtree = streaming.find_subtree(streaming.iter_tree(response), "/ao/1")
+    assert subtree == {"record_uri": "/ao/1", "children": [{"record_uri": "/ao/2", "children": []}]}
+
+def test_async_client():
+    async def run():
+        client, calls = canned_async_client(paged_archival_objects)
+        async with client:
+            objs = [o['uri'] async for o in client.get_paged('repositories/2/archival_objects', page_size=10, workers=3)]
+            assert objs == ["/repositories/2/archival_objects/{}".format(i) for i in range(1, 46)]
+
+        client, calls = canned_async_client(agents_by_id)
+        async with client:
+            agents = [a['uri'] async for a in client.get_paged('agents/people', params={"all_ids": True})]
+            assert agents == ["/agents/people/{}".format(i) for i in range(1, 12)]
+            batched = [a['uri'] async for a in client.get_by_ids('agents/people', [3, 1, 2], batch_size=5)]
+            assert batched == ["/agents/people/3", "/agents/people/1", "/agents/people/2"]
+            assert 'id_set[]' in calls[-1][2]
+
+    asyncio.run(run())
+
+def test_async_client_session_matches_requests():
+    from asnake.client import AsyncASnakeClient
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from threading import Thread
+
+    class Redirecting(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.startswith('/by-external-id'):
+                self.send_response(303)
+                self.send_header('Location', '/repositories/2/resources/1')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = b'{"uri": "/repositories/2/resources/1"}'
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        def log_message(self, *args): pass
+
+    server = HTTPServer(('127.0.0.1', 0), Redirecting)
+    Thread(target=server.serve_forever, daemon=True).start()
+    async def run():
+        async with AsyncASnakeClient(baseurl="http://127.0.0.1:{}".format(server.server_port)) as client:
+            # like requests: redirects are followed and there's no timeout
+            assert client.session.timeout.read is None
+            resp = await client.get('by-external-id', params={"eid": "x"})
+            assert resp.status_code == 200 and resp.json()['uri'] == "/repositories/2/resources/1"
+    try:
+        asyncio.run(run())
+    finally:
+        server.shutdown()
+
+def test_async_client_reauthorizes_on_403():
+    tokens = iter(["a" * 64, "b" * 64])
+    def expiring_session(method, path, query):
+        if path == '/users/admin/login':
+            return {"session": next(tokens)}
+        return (403, {"error": "Access denied"}) if len(calls) < 2 else {"uri": "/users/1"}
+
+    async def run():
+        async with client:
+            assert (await client.get('users/1')).json() == {"uri": "/users/1"}
+            assert client.session.headers['X-ArchivesSpace-Session'] == "a" * 64
+
+    client, calls = canned_async_client(expiring_session)
+    asyncio.run(run())
+
+def subjects(method, path, query):
+    return {"jsonmodel_type": "subject", "uri": path, "title": "Pancakes"}
+
+def test_response_cache(tmp_path):
+    for cache_config in ({"backend": "memory", "route_ttls": {"search": 0}},
+                         {"backend": "sqlite", "path": str(tmp_path / "cache.sqlite"), "route_ttls": {"search": 0}},):
+        client, adapter = canned_client(subjects, cache=cache_config)
+        assert client.get('subjects/1').json()['title'] == "Pancakes"
+        assert client.get('/subjects/1').json()['title'] == "Pancakes"
+        client.get('subjects/1', params={"resolve": ["agents"]})
+        assert len(adapter.calls) == 2
+
+        # route with ttl of 0 isn't cached
+        client.get('repositories/2/search', params={"q": "*"})
+        client.get('repositories/2/search', params={"q": "*"})
+        assert len(adapter.calls) == 4
+
+        # writes drop cached responses for the uri and its subroutes
+        client.get('subjects/1/tree')
+        client.post('subjects/1', json={"title": "Waffles"})
+        client.get('subjects/1')
+        client.get('subjects/1/tree')
+        client.get('subjects/10')
+        assert [p for m, p, q in adapter.calls[5:]] == ['/subjects/1', '/subjects/1', '/subjects/1/tree', '/subjects/10']
+
+def test_response_cache_ttl():
+    client, adapter = canned_client(subjects, cache={"ttl": -1})
+    client.get('subjects/1')
+    client.get('subjects/1')
+    assert len(adapter.calls) == 2
+
+def test_retries_with_backoff():
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from threading import Thread
+    statuses = [503, 429, 200]
+    class Flaky(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(statuses.pop(0) if statuses else 200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            self.wfile.write(b'{}')
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            self.do_GET()
+        def log_message(self, *args): pass
+
+    server = HTTPServer(('127.0.0.1', 0), Flaky)
+    Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        baseurl = "http://127.0.0.1:{}".format(server.server_port)
+        client = ASnakeClient(baseurl=baseurl, max_retries=3, retry_backoff_factor=0, pool_maxsize=4)
+        assert client.session.get_adapter(baseurl)._pool_maxsize == 4
+        assert client.get('version').status_code == 200
+        assert statuses == []
+
+        statuses.extend([503, 503])
+        no_retries = ASnakeClient(baseurl=baseurl)
+        assert no_retries.get('version').status_code == 503
+        # as plain requests, so read timeouts still raise ReadTimeout
+        assert no_retries.session.get_adapter(baseurl).max_retries.read is False
+
+        # the async client retries statuses itself, as httpx only retries connections
+        from asnake.client import AsyncASnakeClient
+        async def run():
+            async with AsyncASnakeClient(baseurl=baseurl, max_retries=3, retry_backoff_factor=0) as client:
+                statuses.extend([503, 429])
+                assert (await client.get('version')).status_code == 200
+                assert statuses == []
+                # POST isn't in retry_methods
+                statuses.extend([503])
+                assert (await client.post('version', json={})).status_code == 503
+            async with AsyncASnakeClient(baseurl=baseurl) as no_retries:
+                statuses.extend([503, 503])
+                assert (await no_retries.get('version')).status_code == 503
+        asyncio.run(run())
+    finally:
+        server.shutdown()
+
+def test_rate_limiter():
+    from asnake.client.ratelimit import RateLimiter
+    from threading import Thread, Lock
+    from time import monotonic, sleep
+
+    limiter = RateLimiter(rate=50, burst=1)
+    start = monotonic()
+    for _ in range(11):
+        with limiter: pass
+    assert monotonic() - start >= 0.19
+
+    capped = RateLimiter(max_concurrent=2)
+    in_flight, peak, lock = [0], [0], Lock()
+    def request():
+        with capped:
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            sleep(0.01)
+            with lock:
+                in_flight[0] -= 1
+    threads = [Thread(target=request) for _ in range(8)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert peak[0] == 2
+
+def test_rate_limiter_backs_off():
+    statuses = iter([429, 503, 200])
+    client, adapter = canned_client(lambda m, p, q: (next(statuses, 200), {}), rate_limit=100)
+    client.get('version'); client.get('version')
+    assert client.rate_limiter.rate == 25
+    client.get('version')
+    assert client.rate_limiter.rate == 30
+
+def test_async_rate_limiter():
+    from asnake.client.ratelimit import AsyncRateLimiter
+    from time import monotonic
+
+    async def run():
+        client, calls = canned_async_client(lambda m, p, q: {}, rate_limit=50, rate_limit_burst=1)
+        start = monotonic()
+        await asyncio.gather(*(client.get('version') for _ in range(11)))
+        assert monotonic() - start >= 0.19
+        assert len(calls) == 11
+
+        capped = AsyncRateLimiter(max_concurrent=2)
+        in_flight, peak = [0], [0]
+        async def request():
+            async with capped:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+                await asyncio.sleep(0.01)
+                in_flight[0] -= 1
+        await asyncio.gather(*(request() for _ in range(8)))
+        assert peak[0] == 2
+    asyncio.run(run())
+
+def test_single_flight_reauthorization():
+    from threading import Thread, Barrier
+    from time import sleep
+    logins = []
+    barrier = Barrier(8)
+    def expiring_session(method, path, query, headers):
+        if path == '/users/admin/login':
+            sleep(0.05)
+            logins.append(path)
+            return {"session": str(len(logins)) * 64}
+        if headers.get('X-ArchivesSpace-Session') != "1" * 64:
+            return (403, {"error": "Access denied"})
+        return {"uri": path}
+
+    client, adapter = canned_client(expiring_session, with_headers=True)
+    results = []
+    def work():
+        barrier.wait()
+        results.append(client.get('repositories/2').status_code)
+    threads = [Thread(target=work) for _ in range(8)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert results == [200] * 8
+    assert len(logins) == 1
+
+def test_bulk_update():
+    from asnake.client.web_client import BulkResult
+    def updates(method, path, query):
+        if path.endswith('/3'):
+            return (409, {"error": "The record you tried to update has been modified since you fetched it."})
+        return {"status": "Updated", "uri": path}
+
+    client, adapter = canned_client(updates)
+    records = ({"uri": "/repositories/2/archival_objects/{}".format(i), "lock_version": 0} for i in range(1, 11))
+    results = list(client.bulk_update(records, workers=4, window=3))
+    assert all(isinstance(r, BulkResult) for r in results)
+    assert sorted(r.uri for r in results) == sorted("/repositories/2/archival_objects/{}".format(i) for i in range(1, 11))
+    assert [r.uri for r in results if r.conflict] == ["/repositories/2/archival_objects/3"]
+    assert len([r for r in results if r.ok]) == 9
+    assert all(m == 'POST' for m, p, q in adapter.calls)
+
+    # a record without a uri fails on its own, the rest are still sent
+    adapter.calls.clear()
+    records = [{"uri": "/subjects/1"}, {"title": "no uri"}, {"uri": "/subjects/2"}]
+    results = list(client.bulk_update(records, ordered=True))
+    assert [r.uri for r in results] == ["/subjects/1", None, "/subjects/2"]
+    assert isinstance(results[1].error, KeyError) and results[1].json == {"title": "no uri"}
+    assert not results[1].ok
+    assert len(adapter.calls) == 2
+
+    ordered = list(client.bulk_post([("/subjects", {"title": str(i)}) for i in range(5)], workers=2, ordered=True))
+    assert [r.json['title'] for r in ordered] == ["0", "1", "2", "3", "4"]
+
+def test_json_backend():
+    import asnake.jsonlib as jsonlib
+    import pytest
+    previous = jsonlib.backend.name
+    seen = []
+    def respond(method, path, query, headers):
+        seen.append(headers.get('Content-Type'))
+        return {"status": "Updated", "uri": path}
+
+    try:
+        for name in ('orjson', 'json'):
+            client, adapter = canned_client(respond, with_headers=True, json_backend=name)
+            assert jsonlib.backend.name == name
+            assert client.post('subjects/1', json={"title": "é", 1: [2 ** 70]}).json() == {"status": "Updated", "uri": "/subjects/1"}
+        assert seen == ['application/json', 'application/json']
+        assert jsonlib.dumps({1: 2}) == b'{"1": 2}' # handed on to json
+        with pytest.raises(ValueError):
+            jsonlib.use('yaml')
+    finally:
+        jsonlib.use(previous)